@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from threading import Lock
+from config import settings
+
+#Cache LRU de horarios ocupados por fecha. Vive en memoria de cada proceso:
+#con varios workers cada uno tiene la suya, y lo que garantiza que no se reserve
+#dos veces el mismo horario sigue siendo el indice unico de la tabla turnos.
+#Las escrituras de este proceso invalidan su fecha al momento; las de otros
+#workers se notan por la version de los datos (ver sincronizar).
+class CacheDisponibilidad:
+    def __init__(self, max_dias: int, activa: bool = True):
+        self.max_dias = max_dias
+        self.activa = activa
+        self.aciertos = 0
+        self.fallos = 0
+        self.version = 0
+        self.version_datos = None
+        self._dias = OrderedDict()
+        self._lock = Lock()
+
+    def sincronizar(self, version_datos: int):
+        # version_datos es el contador de la base que suben los triggers en cada
+        # escritura; si cambio desde la ultima consulta, otro worker pudo haber
+        # reservado o cancelado y se descarta todo lo guardado.
+        with self._lock:
+            if version_datos != self.version_datos:
+                self.version_datos = version_datos
+                self.version += 1
+                self._dias.clear()
+
+    def obtener(self, fecha):
+        if not self.activa:
+            return None
+        with self._lock:
+            if fecha in self._dias:
+                self._dias.move_to_end(fecha)
+                self.aciertos += 1
+                return self._dias[fecha]
+            self.fallos += 1
+            return None
+
+    def guardar(self, ocupados_por_dia: dict, version: int):
+        # Si hubo una invalidacion mientras se consultaba la base, el resultado
+        # puede estar viejo y no se guarda.
+        if not self.activa:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            for fecha, ocupados in ocupados_por_dia.items():
+                self._dias[fecha] = frozenset(ocupados)
+                self._dias.move_to_end(fecha)
+            while len(self._dias) > self.max_dias:
+                self._dias.popitem(last=False)
+
+    def invalidar(self, *fechas):
+        with self._lock:
+            self.version += 1
+            for fecha in fechas:
+                self._dias.pop(fecha, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "activa": self.activa,
+                "dias_en_cache": len(self._dias),
+                "max_dias": self.max_dias,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos
+            }
+
+
+cache_disponibilidad = CacheDisponibilidad(
+    max_dias=settings.CACHE_DISPONIBILIDAD_MAX_DIAS,
+    activa=settings.CACHE_DISPONIBILIDAD_ACTIVA
+)
+
+
+#Cache LRU de respuestas de reportes (JSON, CSV y PDF ya generados). Cada entrada
+#guarda la version de los datos con la que se armo: si la version actual es otra,
+#la entrada ya no vale. El limite es por tamaño total en bytes.
+class CacheReportes:
+    def __init__(self, max_bytes: int, activa: bool = True):
+        self.max_bytes = max_bytes
+        self.activa = activa
+        self.aciertos = 0
+        self.fallos = 0
+        self.bytes = 0
+        self._entradas = OrderedDict()
+        self._lock = Lock()
+
+    def obtener(self, clave, version):
+        if not self.activa:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] != version:
+                if entrada is not None:
+                    self._quitar(clave)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, version, respuesta):
+        # respuesta: (contenido en bytes, media_type, headers)
+        tamanio = len(respuesta[0])
+        if not self.activa or tamanio > self.max_bytes:
+            return
+        with self._lock:
+            self._quitar(clave)
+            self._entradas[clave] = (version, respuesta)
+            self.bytes += tamanio
+            while self.bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is not None:
+            self.bytes -= len(entrada[1][0])
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "activa": self.activa,
+                "entradas": len(self._entradas),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos
+            }
+
+
+cache_reportes = CacheReportes(
+    max_bytes=settings.CACHE_REPORTES_MAX_MB * 1024 * 1024,
+    activa=settings.CACHE_REPORTES_ACTIVA
+)
@@ -17,6 +17,33 @@ class Settings(BaseSettings):
         "12:30", "13:00", "13:30", "14:00", "14:30", "15:00", "15:30", "16:00"
     ]
 
+    MAX_CANCELACIONES: int = 5
+    DIAS_VENTANA_CANCELACIONES: int = 180
+    INTERVALO_DEPURACION_CANCELACIONES_MINUTOS: int = 60
+
+    MAX_DIAS_DISPONIBILIDAD: int = 92
+    HORIZONTE_PROXIMOS_DIAS: int = 90
+    MAX_PROXIMOS_TURNOS: int = 50
+    MAX_TURNOS_POR_LOTE: int = 1000
+    TAMANIO_LOTE_IMPORTACION: int = 1000
+    TAMANIO_LOTE_STREAMING: int = 1000
+
+    CACHE_DISPONIBILIDAD_ACTIVA: bool = True
+    CACHE_DISPONIBILIDAD_MAX_DIAS: int = 400
+    CACHE_REPORTES_ACTIVA: bool = True
+    CACHE_REPORTES_MAX_MB: int = 64
+
+    DIRECTORIO_TRABAJOS: str = "trabajos_reportes"
+    MAX_TRABAJOS_REPORTES: int = 2
+    MAX_TRABAJOS_EN_COLA: int = 20
+    TTL_TRABAJOS_MINUTOS: int = 60
+
+    PROCESOS_PDF: int = 2
+    MAX_PDF_EN_CURSO: int = 8
+    TIMEOUT_PDF_SEGUNDOS: int = 60
+    TIMEOUT_PDF_TRABAJOS_SEGUNDOS: int = 1800
+    FILAS_POR_PAGINA_PDF: int = 30
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,132 @@
+import codecs
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from models import Persona
+from utils import MENSAJES_DUPLICADO
+
+#Importacion masiva de personas (POST /personas/import). El archivo se lee por
+#lineas a medida que llega y se procesa en lotes de TAMANIO_LOTE_IMPORTACION filas.
+
+CAMPOS_OBLIGATORIOS = ("dni", "nombre", "email", "telefono", "fecha_de_nacimiento")
+
+
+async def leer_lineas(request):
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    async for bloque in request.stream():
+        pendiente += decodificador.decode(bloque)
+        *lineas, pendiente = pendiente.split("\n")
+        for linea in lineas:
+            yield linea.rstrip("\r")
+    pendiente += decodificador.decode(b"", final=True)
+    if pendiente.strip():
+        yield pendiente.rstrip("\r")
+
+
+def parsear_csv(linea, encabezado):
+    valores = next(csv.reader([linea]))
+    if len(valores) != len(encabezado):
+        raise ValueError(f"Se esperaban {len(encabezado)} columnas y hay {len(valores)}")
+    return dict(zip(encabezado, valores))
+
+
+def parsear_ndjson(linea):
+    try:
+        datos = json.loads(linea)
+    except json.JSONDecodeError:
+        raise ValueError("La línea no es JSON válido")
+    if not isinstance(datos, dict):
+        raise ValueError("Cada línea debe ser un objeto JSON")
+    return datos
+
+
+def validar_persona(datos):
+    # Mismas reglas que crear_persona; devuelve (fila, None) o (None, error)
+    faltantes = [c for c in CAMPOS_OBLIGATORIOS if datos.get(c) in (None, "")]
+    if faltantes:
+        return None, f"Faltan campos obligatorios: {', '.join(faltantes)}"
+    try:
+        dni = int(datos["dni"])
+    except (TypeError, ValueError):
+        return None, "El DNI debe ser un número"
+    try:
+        telefono = int(datos["telefono"])
+    except (TypeError, ValueError):
+        return None, "El teléfono debe ser un número"
+    try:
+        fecha_nac = datetime.strptime(str(datos["fecha_de_nacimiento"]), "%Y-%m-%d").date()
+    except ValueError:
+        return None, "Formato de fecha inválido, use YYYY-MM-DD"
+
+    # Una celda vacia (o null) cuenta como no informada: habilitado, como en POST /personas
+    habilitado = datos.get("habilitado")
+    if isinstance(habilitado, str):
+        habilitado = habilitado.strip().lower()
+    if habilitado is None or habilitado == "":
+        habilitado = True
+    elif isinstance(habilitado, str):
+        habilitado = habilitado not in ("0", "false", "no")
+
+    return {
+        "dni": dni,
+        "nombre": datos["nombre"],
+        "email": datos["email"],
+        "telefono": telefono,
+        "fecha_de_nacimiento": fecha_nac,
+        "habilitado": bool(habilitado)
+    }, None
+
+
+def importar_lote(session, lote, vistos):
+    # lote: lista de (numero_de_fila, fila_validada). vistos: dni/email/telefono ya
+    # aceptados en lotes anteriores del mismo archivo. Devuelve (importadas, errores).
+    existentes = {"dni": set(), "email": set(), "telefono": set()}
+    for dni, email, telefono in session.query(Persona.dni, Persona.email, Persona.telefono).filter(or_(
+        Persona.dni.in_({fila["dni"] for _, fila in lote}),
+        Persona.email.in_({fila["email"] for _, fila in lote}),
+        Persona.telefono.in_({fila["telefono"] for _, fila in lote})
+    )):
+        existentes["dni"].add(dni)
+        existentes["email"].add(email)
+        existentes["telefono"].add(telefono)
+
+    errores = []
+    aceptadas = []
+    for numero, fila in lote:
+        duplicado = next(
+            (campo for campo in ("dni", "email", "telefono")
+             if fila[campo] in existentes[campo] or fila[campo] in vistos[campo]),
+            None
+        )
+        if duplicado:
+            errores.append({"fila": numero, "error": MENSAJES_DUPLICADO[duplicado]})
+            continue
+        for campo in ("dni", "email", "telefono"):
+            vistos[campo].add(fila[campo])
+        aceptadas.append((numero, fila))
+
+    if not aceptadas:
+        return 0, errores
+
+    try:
+        session.execute(insert(Persona), [fila for _, fila in aceptadas])
+        session.commit()
+        return len(aceptadas), errores
+    except IntegrityError:
+        # Otro pedido inserto alguno de estos datos mientras tanto: se reintenta
+        # fila por fila para saber cuales quedan afuera.
+        session.rollback()
+
+    importadas = 0
+    for numero, fila in aceptadas:
+        try:
+            session.execute(insert(Persona), [fila])
+            session.commit()
+            importadas += 1
+        except IntegrityError:
+            session.rollback()
+            errores.append({"fila": numero, "error": "El DNI, email o teléfono ya está registrado"})
+    return importadas, errores
@@ -1,32 +1,66 @@
 from fastapi import FastAPI, HTTPException, Request, status, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from models import Persona, Turnos, Base
 from database import SessionLocal, engine
 from datetime import datetime, date, timedelta
 from config import settings
-from utils import calcular_edad, turnoDisponible, turnoDisponibleEstado, MESES_ESPANOL
+from cache import cache_disponibilidad, cache_reportes
+from trabajos import trabajos_reportes, ESTADO_TERMINADO
+from schemas import PersonaOut, TurnoOut, PaginaPersonas, PaginaTurnos, BusquedaPersonas, persona_out
+import reportes
+from pdf import renderizar_pdf, PdfOcupado, cerrar_pool, estadisticas as estadisticas_pdf
+from utils import calcular_edad, expresion_edad, horarios_ocupados_por_dia, horarios_libres, mascara_horarios, hora_a_minutos, minutos_a_hora, MINUTOS_VALIDOS, MESES_ESPANOL
+from utils import consulta_busqueda_personas, contar_filas, campo_duplicado, MENSAJES_DUPLICADO, proximos_horarios_libres, registrar_cancelacion, anular_cancelacion, depurar_cancelaciones, version_datos
+from streaming import pide_ndjson, respuesta_ndjson, respuesta_csv, respuesta_columnar, importar_pyarrow
+from importacion import leer_lineas, parsear_csv, parsear_ndjson, validar_persona, importar_lote
+from migraciones import migrar_hora_a_minutos, migrar_contador_cancelaciones, crear_conteos, crear_version_datos, crear_busqueda_personas, crear_indices
 import pandas as pd
-from io import BytesIO
-from fastapi.responses import StreamingResponse
-import borb as borb
-from borb.pdf.document import Document
-from borb.pdf.page.page import Page
-from borb.pdf.pdf import PDF
-from borb.pdf.canvas.layout.table.table import Table
-from borb.pdf.canvas.layout.text.paragraph import Paragraph
-from borb.pdf.canvas.layout.table.flexible_column_width_table import FlexibleColumnWidthTable
-from borb.pdf.canvas.layout.page_layout.multi_column_layout import SingleColumnLayout
-from io import StringIO
-from borb.pdf.canvas.color.color import HexColor
-from borb.pdf.canvas.layout.layout_element import Alignment
-from borb.pdf.canvas.layout.table.table import TableCell
-from decimal import Decimal
-from borb.pdf.canvas.layout.image.image import Image
-from pathlib import Path
-
-app = FastAPI()
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+import csv
+from typing import Optional
+from contextlib import asynccontextmanager
+from functools import wraps
+from urllib.parse import urlencode
+import inspect
+from pydantic import TypeAdapter, ValidationError
+from fastapi.responses import FileResponse
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
 Base.metadata.create_all(bind=engine)
+migrar_hora_a_minutos(engine)
+migrar_contador_cancelaciones(engine)
+crear_conteos(engine)
+crear_version_datos(engine)
+BUSQUEDA_FTS = crear_busqueda_personas(engine)
+crear_indices(engine)
+
+def _depurar_cancelaciones():
+    db = SessionLocal()
+    try:
+        depurar_cancelaciones(db)
+    finally:
+        db.close()
+
+async def depurar_cancelaciones_periodicamente():
+    while True:
+        try:
+            await run_in_threadpool(_depurar_cancelaciones)
+        except Exception as e:
+            print(f"Error depurando cancelaciones: {e}")
+        await asyncio.sleep(settings.INTERVALO_DEPURACION_CANCELACIONES_MINUTOS * 60)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tarea = asyncio.create_task(depurar_cancelaciones_periodicamente())
+    yield
+    tarea.cancel()
+    cerrar_pool()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 def get_db():
     db = SessionLocal()
@@ -35,199 +69,140 @@ def get_db():
     finally:
         db.close()
 
-#Hecho por Kevin Soto Lesama
-def generar_pdf_borb(datos_df: pd.DataFrame, titulo: str) -> BytesIO:
-    datos_df = datos_df.astype(str)
-    
+async def generar_pdf_response(request: Request, df: pd.DataFrame, titulo: str, disposicion: str):
+    # generar_reporte marca request.state.trabajo: esos PDFs ya corren en segundo
+    # plano, asi que no pasan por el limite ni por el timeout de los pedidos directos.
+    trabajo = getattr(request.state, "trabajo", False)
     try:
-        pdf = Document()
-        page = Page()
-        pdf.append_page(page)
-        
-        layout = SingleColumnLayout(page, 
-                                    vertical_margin=Decimal(40), 
-                                    horizontal_margin=Decimal(40))
-        
-        ruta_logo = Path("logo_unla.png") 
-        
-        if ruta_logo.exists():
-            layout.add(Image(
-                ruta_logo,
-                width=Decimal(80),   
-                height=Decimal(80), 
-                horizontal_alignment=Alignment.CENTERED,
-                margin_bottom=Decimal(10)
-            ))
-        else:
-            print("AVISO: No se encontró 'logo_unla.png'.")
-
-        layout.add(Paragraph(
-            titulo, 
-            font="Helvetica-Bold", 
-            font_size=20, 
-            horizontal_alignment=Alignment.CENTERED,
-            padding_bottom=Decimal(5)
-        ))
-        
-        fecha_emision = datetime.now().strftime("%d/%m/%Y %H:%M")
-        layout.add(Paragraph(
-            f"Emitido el: {fecha_emision}", 
-            font="Helvetica-Oblique", 
-            font_size=10, 
-            horizontal_alignment=Alignment.CENTERED,
-            padding_bottom=Decimal(20)
-        ))
-
-        num_cols = len(datos_df.columns)
-        if num_cols == 0:
-            layout.add(Paragraph("No hay datos para mostrar."))
-            buffer = BytesIO()
-            PDF.dumps(buffer, pdf)
-            buffer.seek(0)
-            return buffer
-
-        table = FlexibleColumnWidthTable(number_of_columns=num_cols, number_of_rows=len(datos_df) + 1)
-        
-        for col in datos_df.columns:
-            table.add(TableCell(
-                Paragraph(str(col), font="Helvetica-Bold", font_color=HexColor("FFFFFF"), font_size=10),
-                background_color=HexColor("585858"), 
-                padding_top=Decimal(5),
-                padding_bottom=Decimal(5),
-                padding_left=Decimal(5)
-            ))
-            
-        for i, row in datos_df.iterrows():
-            bg_color = HexColor("FFFFFF") if i % 2 == 0 else HexColor("F2F2F2")
-            for item in row:
-                table.add(TableCell(
-                    Paragraph(item, font_size=9),
-                    background_color=bg_color,
-                    padding_top=Decimal(4),
-                    padding_bottom=Decimal(4),
-                    padding_left=Decimal(5)
-                ))
-                
-        layout.add(table)
-        
-        layout.add(Paragraph(
-            "\nUniversidad Nacional de Lanús - Sistema de Turnos",
-            font_size=8,
-            font_color=HexColor("808080"),
-            horizontal_alignment=Alignment.CENTERED,
-            padding_top=Decimal(20)
-        ))
-        
-        buffer = BytesIO()
-        PDF.dumps(buffer, pdf)
-        buffer.seek(0)
-        return buffer
-
+        contenido = await renderizar_pdf(list(df.columns), df.values.tolist(), titulo, trabajo=trabajo)
+    except PdfOcupado:
+        raise HTTPException(status_code=503, detail="Hay demasiados PDFs generándose, intente más tarde o use /reportes/jobs")
+    except asyncio.TimeoutError:
+        if trabajo:
+            raise HTTPException(status_code=504, detail=f"El PDF tardó más de {settings.TIMEOUT_PDF_TRABAJOS_SEGUNDOS} segundos en generarse")
+        raise HTTPException(status_code=504, detail="El PDF tardó demasiado en generarse, use /reportes/jobs")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Se reinició el generador de PDFs, intente nuevamente")
     except Exception as e:
-        print(f"Error generando PDF: {e}")
-        buffer = BytesIO()
-        err_pdf = Document()
-        err_page = Page()
-        err_pdf.append_page(err_page)
-        SingleColumnLayout(err_page).add(Paragraph(f"Error: {str(e)}"))
-        PDF.dumps(buffer, err_pdf)
-        buffer.seek(0)
-        return buffer
-    
-    
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el PDF: {str(e)}")
+    return Response(contenido, media_type="application/pdf", headers={"Content-Disposition": disposicion})
+
 #Hecho por Agustin Nicolás Mancini
-def generar_csv_response(df: pd.DataFrame, filename: str):
-    buffer = StringIO()
-    df.to_csv(buffer, index=False)
-    buffer.seek(0)
-
-    return StreamingResponse(
-        buffer,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+def generar_csv_response(request: Request, consulta, encabezados: dict, filename: str):
+    # CSV por lotes desde la consulta (ver streaming.py); None si no hay filas
+    try:
+        return respuesta_csv(request, consulta, encabezados, filename)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
+
+def generar_columnar_response(formato: str, consulta, nombre: str):
+    # formato es "parquet" o "arrow" (ver FORMATOS_COLUMNARES); None si no hay filas
+    if importar_pyarrow() is None:
+        raise HTTPException(status_code=501, detail=f"El formato {formato} requiere instalar pyarrow")
+    try:
+        return respuesta_columnar(consulta, formato, nombre)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
+
+def consulta_listado_personas(db: Session, skip: int, after_id: Optional[int], limit: Optional[int]):
+    consulta = db.query(Persona, expresion_edad(Persona.fecha_de_nacimiento, date.today())).order_by(Persona.id)
+    if after_id is not None:
+        # Modo cursor: busca por clave primaria en vez de recorrer 'skip' filas
+        consulta = consulta.filter(Persona.id > after_id)
+    else:
+        consulta = consulta.offset(skip)
+    return consulta.limit(limit)
+
 # Hecho por Kevin Lesama Soto
-@app.get("/personas")
+@app.get("/personas", response_model=PaginaPersonas)
 def listar_personas(
+    request: Request,
     skip: int = Query(0, ge=0, description="Número de registros a omitir (offset)"),
-    limit: int = Query(100, gt=0, le=200, description="Máximo número de registros a devolver (limit)"),
+    limit: Optional[int] = Query(None, gt=0, le=200, description="Máximo número de registros a devolver (limit). Por defecto 100; en modo NDJSON, sin límite"),
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: devolver registros con id mayor a este (reemplaza a skip)"),
+    include_total: bool = Query(True, description="Incluir el total de registros en la respuesta"),
     db: Session = Depends(get_db)
 ):
     try:
-        total_personas = db.query(Persona).count()
-        
-        personas_paginadas = db.query(Persona).offset(skip).limit(limit).all() 
+        if pide_ndjson(request):
+            return respuesta_ndjson(
+                lambda sesion: consulta_listado_personas(sesion, skip, after_id, limit),
+                lambda fila: persona_out(*fila).model_dump()
+            )
 
-        resultado = []
-        for p in personas_paginadas:
-            try:
-                edad = calcular_edad(p.fecha_de_nacimiento) if p.fecha_de_nacimiento else None
-            except Exception:
-                edad = None
-                
-            resultado.append({
-                "id": p.id,
-                "dni": p.dni,
-                "nombre": p.nombre,
-                "email": p.email,
-                "telefono": p.telefono,
-                "fecha_de_nacimiento": p.fecha_de_nacimiento.isoformat() if p.fecha_de_nacimiento else None,
-                "edad": edad,
-                "habilitado": p.habilitado
-            })
-            
-        return {
-            "total": total_personas,
-            "skip": skip,
-            "limit": limit,
-            "data": resultado
-        }
+        limit = limit or 100
+        personas_paginadas = consulta_listado_personas(db, skip, after_id, limit).all()
+
+        return PaginaPersonas(
+            total=contar_filas(db, Persona) if include_total else None,
+            skip=skip if after_id is None else None,
+            after_id=after_id,
+            limit=limit,
+            next_cursor=personas_paginadas[-1][0].id if len(personas_paginadas) == limit else None,
+            data=[persona_out(p, edad) for p, edad in personas_paginadas]
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al recuperar el listado de personas: {str(e)}")
+
+@app.get("/personas/buscar", response_model=BusquedaPersonas)
+def buscar_personas(
+    q: str = Query(..., min_length=1, description="Palabras a buscar en nombre o email (por prefijo)"),
+    skip: int = Query(0, ge=0, description="Número de registros a omitir (offset)"),
+    limit: int = Query(20, gt=0, le=200, description="Máximo número de registros a devolver (limit)"),
+    db: Session = Depends(get_db)
+):
+    try:
+        coincidencias = consulta_busqueda_personas(q, BUSQUEDA_FTS)
+        if coincidencias is None:
+            raise HTTPException(status_code=400, detail="La búsqueda debe contener al menos una palabra")
+
+        personas = (
+            db.query(Persona, expresion_edad(Persona.fecha_de_nacimiento, date.today()))
+            .join(coincidencias, coincidencias.c.id == Persona.id)
+            .order_by(coincidencias.c.rango, Persona.id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+
+        return BusquedaPersonas(
+            q=q, skip=skip, limit=limit,
+            data=[persona_out(p, edad) for p, edad in personas]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al buscar personas: {str(e)}")
+
 #Hecho por Kevin Lesama Soto
-@app.get("/personas/{id}")
+@app.get("/personas/{id}", response_model=PersonaOut)
 def obtener_persona(id: int, db: Session = Depends(get_db)):
     try:
-        persona = db.query(Persona).get(id)
-        if persona is None:
+        fila = db.query(Persona, expresion_edad(Persona.fecha_de_nacimiento, date.today())).filter(Persona.id == id).first()
+        if fila is None:
             raise HTTPException(status_code=404, detail="Persona no encontrada")
-        try:
-            edad = calcular_edad(persona.fecha_de_nacimiento) if persona.fecha_de_nacimiento else None
-        except Exception:
-            edad = None
-        return {
-            "id": persona.id,
-            "dni": persona.dni,
-            "nombre": persona.nombre,
-            "email": persona.email,
-            "telefono": persona.telefono,
-            "fecha_de_nacimiento": persona.fecha_de_nacimiento.isoformat() if persona.fecha_de_nacimiento else None,
-            "edad": edad,
-            "habilitado": persona.habilitado
-        }
+        persona, edad = fila
+        return persona_out(persona, edad)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener la persona: {str(e)}")
 
 #Hecho por Kevin Lesama Soto
-@app.post("/personas")
+@app.post("/personas", response_model=PersonaOut)
 async def crear_persona(request: Request, db: Session = Depends(get_db)):
     try:
         datos = await request.json()
 
-        if db.query(Persona).filter_by(dni=datos["dni"]).first():
-            raise HTTPException(status_code=400, detail="El DNI ya está registrado")
-        if db.query(Persona).filter_by(email=datos["email"]).first():
-            raise HTTPException(status_code=400, detail="El email ya está registrado")
-        if db.query(Persona).filter_by(telefono=datos["telefono"]).first():
-            raise HTTPException(status_code=400, detail="El teléfono ya está registrado")
-
         try:
             datos["telefono"] = int(datos["telefono"])
         except ValueError:
             raise HTTPException(status_code=400, detail="El teléfono debe ser un número")
+
+        duplicado = campo_duplicado(db, dni=datos["dni"], email=datos["email"], telefono=datos["telefono"])
+        if duplicado:
+            raise HTTPException(status_code=400, detail=MENSAJES_DUPLICADO[duplicado])
         
         try:
             fecha_nac = datetime.strptime(datos["fecha_de_nacimiento"], "%Y-%m-%d").date()
@@ -244,27 +219,77 @@ async def crear_persona(request: Request, db: Session = Depends(get_db)):
         )
 
         db.add(nueva_persona)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="El DNI, email o teléfono ya está registrado")
         db.refresh(nueva_persona)
 
-        return {
-            "id": nueva_persona.id,
-            "dni": nueva_persona.dni,
-            "nombre": nueva_persona.nombre,
-            "email": nueva_persona.email,
-            "telefono": nueva_persona.telefono,
-            "fecha_de_nacimiento": nueva_persona.fecha_de_nacimiento.isoformat(),
-            "edad": calcular_edad(nueva_persona.fecha_de_nacimiento),
-            "habilitado": nueva_persona.habilitado
-        }
+        return persona_out(nueva_persona, calcular_edad(nueva_persona.fecha_de_nacimiento))
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al crear la persona: {str(e)}")
 
+@app.post("/personas/import")
+async def importar_personas(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Por defecto se toma del Content-Type"),
+    db: Session = Depends(get_db)
+):
+    try:
+        if formato is None:
+            tipo = request.headers.get("content-type", "")
+            formato = "ndjson" if "ndjson" in tipo or "jsonl" in tipo else "csv"
+
+        procesadas = 0
+        importadas = 0
+        errores = []
+        vistos = {"dni": set(), "email": set(), "telefono": set()}
+        lote = []
+        encabezado = None
+
+        async for linea in leer_lineas(request):
+            if not linea.strip():
+                continue
+            if formato == "csv" and encabezado is None:
+                encabezado = [c.strip() for c in next(csv.reader([linea]))]
+                continue
+
+            procesadas += 1
+            try:
+                datos = parsear_csv(linea, encabezado) if formato == "csv" else parsear_ndjson(linea)
+                fila, error = validar_persona(datos)
+            except ValueError as e:
+                fila, error = None, str(e)
+            if error:
+                errores.append({"fila": procesadas, "error": error})
+                continue
+
+            lote.append((procesadas, fila))
+            if len(lote) >= settings.TAMANIO_LOTE_IMPORTACION:
+                cantidad, errores_lote = await run_in_threadpool(importar_lote, db, lote, vistos)
+                importadas += cantidad
+                errores.extend(errores_lote)
+                lote = []
+
+        if lote:
+            cantidad, errores_lote = await run_in_threadpool(importar_lote, db, lote, vistos)
+            importadas += cantidad
+            errores.extend(errores_lote)
+
+        errores.sort(key=lambda e: e["fila"])
+        return {"procesadas": procesadas, "importadas": importadas, "errores": errores}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al importar las personas: {str(e)}")
+
 #Hecho por Nahuel Garcia
-@app.put("/personas/{persona_id}")
+@app.put("/personas/{persona_id}", response_model=PersonaOut)
 async def modificar_persona(persona_id: int, request: Request, db: Session = Depends(get_db)):
     try:
         persona = db.query(Persona).get(persona_id)
@@ -280,20 +305,13 @@ async def modificar_persona(persona_id: int, request: Request, db: Session = Dep
             except ValueError:
                 raise HTTPException(status_code=400, detail="El teléfono debe ser un número")
 
-        if "dni" in datos and datos["dni"] != persona.dni:
-            if db.query(Persona).filter_by(dni=datos["dni"]).first():
-                raise HTTPException(status_code=400, detail="El DNI ya está registrado")
-            persona.dni = datos["dni"]
-
-        if "email" in datos and datos["email"] != persona.email:
-            if db.query(Persona).filter_by(email=datos["email"]).first():
-                raise HTTPException(status_code=400, detail="El email ya está registrado")
-            persona.email = datos["email"]
-
-        if "telefono" in datos and datos["telefono"] != persona.telefono:
-            if db.query(Persona).filter_by(telefono=datos["telefono"]).first():
-                raise HTTPException(status_code=400, detail="El teléfono ya está registrado")
-            persona.telefono = datos["telefono"]
+        cambios = {
+            campo: datos[campo] for campo in ("dni", "email", "telefono")
+            if campo in datos and datos[campo] != getattr(persona, campo)
+        }
+        duplicado = campo_duplicado(db, excluir_id=persona.id, **cambios)
+        if duplicado:
+            raise HTTPException(status_code=400, detail=MENSAJES_DUPLICADO[duplicado])
 
         if "fecha_de_nacimiento" in datos:
             try:
@@ -304,19 +322,14 @@ async def modificar_persona(persona_id: int, request: Request, db: Session = Dep
         for campo, valor in datos.items():
             setattr(persona, campo, valor)
 
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="El DNI, email o teléfono ya está registrado")
         db.refresh(persona)
 
-        return {
-            "id": persona.id,
-            "dni": persona.dni,
-            "nombre": persona.nombre,
-            "email": persona.email,
-            "telefono": persona.telefono,
-            "fecha_de_nacimiento": persona.fecha_de_nacimiento.isoformat(),
-            "edad": calcular_edad(persona.fecha_de_nacimiento),
-            "habilitado": persona.habilitado
-        }
+        return persona_out(persona, calcular_edad(persona.fecha_de_nacimiento))
 
     except HTTPException:
         raise
@@ -342,62 +355,61 @@ def eliminar_persona(id: int, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al eliminar la persona: {str(e)}")
 
+def consulta_listado_turnos(db: Session, skip: int, after_id: Optional[int], limit: Optional[int]):
+    consulta = db.query(Turnos).order_by(Turnos.id)
+    if after_id is not None:
+        # Modo cursor: busca por clave primaria en vez de recorrer 'skip' filas
+        consulta = consulta.filter(Turnos.id > after_id)
+    else:
+        consulta = consulta.offset(skip)
+    return consulta.limit(limit)
+
 # Hecho por Agustin Nicolas Mancini
-@app.get("/turnos")
+@app.get("/turnos", response_model=PaginaTurnos)
 def listar_turnos(
+    request: Request,
     skip: int = Query(0, ge=0, description="Número de registros a omitir (offset)"),
-    limit: int = Query(100, gt=0, le=200, description="Máximo número de registros a devolver (limit)"),
+    limit: Optional[int] = Query(None, gt=0, le=200, description="Máximo número de registros a devolver (limit). Por defecto 100; en modo NDJSON, sin límite"),
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: devolver registros con id mayor a este (reemplaza a skip)"),
+    include_total: bool = Query(True, description="Incluir el total de registros en la respuesta"),
     db: Session = Depends(get_db)
 ):
     try:
-        total_turnos = db.query(Turnos).count()
-        
+        if pide_ndjson(request):
+            return respuesta_ndjson(
+                lambda sesion: consulta_listado_turnos(sesion, skip, after_id, limit),
+                lambda turno: TurnoOut.model_validate(turno).model_dump()
+            )
 
-        turnos_paginados = db.query(Turnos).offset(skip).limit(limit).all()
-        
+        limit = limit or 100
+        turnos_paginados = consulta_listado_turnos(db, skip, after_id, limit).all()
 
-        resultado = [
-            {
-                "id": t.id,
-                "fecha": t.fecha.isoformat() if t.fecha else None, 
-                "hora": t.hora,
-                "estado": t.estado,
-                "persona_id": t.persona_id
-            }
-            for t in turnos_paginados
-        ]
-        
-        return {
-            "total": total_turnos,
-            "skip": skip,
-            "limit": limit,
-            "data": resultado
-        }
+        return PaginaTurnos(
+            total=contar_filas(db, Turnos) if include_total else None,
+            skip=skip if after_id is None else None,
+            after_id=after_id,
+            limit=limit,
+            next_cursor=turnos_paginados[-1].id if len(turnos_paginados) == limit else None,
+            data=[TurnoOut.model_validate(t) for t in turnos_paginados]
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al recuperar el listado de turnos: {str(e)}")
 #Hecho por Agustin Nicolas Mancini
-@app.get("/turnos/{id}")
+@app.get("/turnos/{id}", response_model=TurnoOut)
 def obtener_turno(id: int, db: Session = Depends(get_db)):
     try:
         turno = db.query(Turnos).get(id)
         if turno is None:
             raise HTTPException(status_code=404, detail="Turno no encontrado")
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha.isoformat(),
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
-        return resultado
+        return TurnoOut.model_validate(turno)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener el turno: {str(e)}")
 
 #Hecho por Agustin Nicolas Mancini
-@app.post("/turnos", status_code=status.HTTP_201_CREATED)
+@app.post("/turnos", status_code=status.HTTP_201_CREATED, response_model=TurnoOut)
 async def crear_turno(request: Request, db: Session = Depends(get_db)):
     try:
         datos = await request.json()
@@ -416,51 +428,40 @@ async def crear_turno(request: Request, db: Session = Depends(get_db)):
         except ValueError:
             raise HTTPException(status_code=400, detail="Formato de fecha inválido, use YYYY-MM-DD")
 
-        if not turnoDisponible(db, fecha_obj, hora=hora) and not turnoDisponibleEstado(db, fecha_obj, hora):
-            raise HTTPException(status_code=400, detail="Esa hora no se encuentra disponible. Seleccione otra hora.")
-        
-        
-        if hora not in settings.HORARIOS_VALIDOS:
+        try:
+            minutos = hora_a_minutos(hora)
+        except (TypeError, ValueError):
+            minutos = None
+        if minutos not in MINUTOS_VALIDOS:
             raise HTTPException(status_code=400, detail="La hora debe estar entre 09:00 y 16:00 en intervalos de 30 minutos")
 
-        seis_meses_atras = date.today() - timedelta(days=180)
-        turnos_cancelados = (
-            db.query(Turnos).filter(
-                Turnos.persona_id == persona.id,
-                Turnos.estado == settings.ESTADO_CANCELADO,
-                Turnos.fecha >= seis_meses_atras
-            ).count()
-        )
-        if turnos_cancelados >= 5 :
-            persona.habilitado = False
-            db.commit()
+        if persona.cancelaciones_recientes >= settings.MAX_CANCELACIONES:
             raise HTTPException(
                 status_code=400,
                 detail="La persona tiene 5 o más turnos cancelados en los últimos 6 meses"
             )
-        else:
-            persona.habilitado = True
-            db.commit()
 
-        
+        # La disponibilidad la garantiza el indice unico parcial sobre (fecha, hora):
+        # no se consulta antes, se inserta y un choque significa horario tomado.
         nuevo_turno = Turnos(
             fecha=fecha_obj, 
-            hora=datos.get("hora"),
+            hora=minutos,
             estado=datos.get("estado", settings.ESTADO_PENDIENTE),
             persona_id=datos.get("persona_id")
         )
         db.add(nuevo_turno)
-        db.commit()
+        try:
+            if nuevo_turno.estado == settings.ESTADO_CANCELADO:
+                db.flush()
+                registrar_cancelacion(db, persona.id, nuevo_turno.id, fecha_obj)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Esa hora no se encuentra disponible. Seleccione otra hora.")
+        cache_disponibilidad.invalidar(fecha_obj)
         db.refresh(nuevo_turno)
 
-        resultado = {
-            "id": nuevo_turno.id,
-            "fecha": nuevo_turno.fecha.isoformat(), 
-            "hora": nuevo_turno.hora,
-            "estado": nuevo_turno.estado,
-            "persona_id": nuevo_turno.persona_id
-        }
-        return resultado
+        return TurnoOut.model_validate(nuevo_turno)
     except HTTPException:
         raise
     except Exception as e:
@@ -468,8 +469,109 @@ async def crear_turno(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al crear el turno: {str(e)}")
 
 
+@app.post("/turnos/batch")
+async def crear_turnos_lote(request: Request, db: Session = Depends(get_db)):
+    try:
+        datos = await request.json()
+        items = datos.get("turnos") if isinstance(datos, dict) else datos
+        if not isinstance(items, list) or not items:
+            raise HTTPException(status_code=400, detail="Envíe una lista de turnos")
+        if len(items) > settings.MAX_TURNOS_POR_LOTE:
+            raise HTTPException(status_code=400, detail=f"El lote no puede superar {settings.MAX_TURNOS_POR_LOTE} turnos")
+
+        resultados = [None] * len(items)
+        candidatos = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("fecha") or not item.get("hora"):
+                resultados[i] = {"indice": i, "error": "La fecha y la hora son obligatorias"}
+                continue
+            try:
+                fecha_obj = datetime.strptime(item["fecha"], "%Y-%m-%d").date()
+            except (TypeError, ValueError):
+                resultados[i] = {"indice": i, "error": "Formato de fecha inválido, use YYYY-MM-DD"}
+                continue
+            try:
+                minutos = hora_a_minutos(item["hora"])
+            except (TypeError, ValueError):
+                minutos = None
+            if minutos not in MINUTOS_VALIDOS:
+                resultados[i] = {"indice": i, "error": "La hora debe estar entre 09:00 y 16:00 en intervalos de 30 minutos"}
+                continue
+            candidatos.append((i, {
+                "fecha": fecha_obj,
+                "hora": minutos,
+                "estado": item.get("estado", settings.ESTADO_PENDIENTE),
+                "persona_id": item.get("persona_id")
+            }))
+
+        # Una consulta IN por cada verificacion, sin importar el tamaño del lote
+        persona_ids = {fila["persona_id"] for _, fila in candidatos}
+        cancelados_por_persona = dict(
+            db.query(Persona.id, Persona.cancelaciones_recientes).filter(Persona.id.in_(persona_ids)).all()
+        )
+
+        fechas = {fila["fecha"] for _, fila in candidatos}
+        horarios_ocupados = set(
+            db.query(Turnos.fecha, Turnos.hora)
+            .filter(Turnos.fecha.in_(fechas), Turnos.estado != settings.ESTADO_CANCELADO)
+            .all()
+        )
+
+        a_insertar = []
+        for i, fila in candidatos:
+            if fila["persona_id"] not in cancelados_por_persona:
+                resultados[i] = {"indice": i, "error": "Persona no encontrada"}
+            elif cancelados_por_persona[fila["persona_id"]] >= settings.MAX_CANCELACIONES:
+                resultados[i] = {"indice": i, "error": "La persona tiene 5 o más turnos cancelados en los últimos 6 meses"}
+            elif fila["estado"] != settings.ESTADO_CANCELADO and (fila["fecha"], fila["hora"]) in horarios_ocupados:
+                resultados[i] = {"indice": i, "error": "Esa hora no se encuentra disponible. Seleccione otra hora."}
+            else:
+                if fila["estado"] != settings.ESTADO_CANCELADO:
+                    horarios_ocupados.add((fila["fecha"], fila["hora"]))
+                a_insertar.append((i, fila))
+
+        if a_insertar:
+            try:
+                ids = db.scalars(
+                    insert(Turnos).returning(Turnos.id, sort_by_parameter_order=True),
+                    [fila for _, fila in a_insertar]
+                ).all()
+                for id, (_, fila) in zip(ids, a_insertar):
+                    if fila["estado"] == settings.ESTADO_CANCELADO:
+                        registrar_cancelacion(db, fila["persona_id"], id, fila["fecha"])
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                raise HTTPException(
+                    status_code=409,
+                    detail="Otro pedido reservó alguno de los horarios mientras se procesaba el lote. Reintente."
+                )
+            cache_disponibilidad.invalidar(*{fila["fecha"] for _, fila in a_insertar})
+
+            for id, (i, fila) in zip(ids, a_insertar):
+                resultados[i] = {
+                    "indice": i,
+                    "id": id,
+                    "fecha": fila["fecha"].isoformat(),
+                    "hora": minutos_a_hora(fila["hora"]),
+                    "estado": fila["estado"],
+                    "persona_id": fila["persona_id"]
+                }
+
+        return {
+            "creados": len(a_insertar),
+            "rechazados": len(items) - len(a_insertar),
+            "resultados": resultados
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al crear los turnos: {str(e)}")
+
+
 #Hecho por Orion Jaime
-@app.put("/turnos/{id}")
+@app.put("/turnos/{id}", response_model=TurnoOut)
 async def modificar_turno(id: int, request: Request, db: Session = Depends(get_db)):
     try:
         datos = await request.json()
@@ -480,8 +582,22 @@ async def modificar_turno(id: int, request: Request, db: Session = Depends(get_d
         if turno.estado == settings.ESTADO_CANCELADO or turno.estado == settings.ESTADO_ASISTIDO:
                 raise HTTPException(status_code=400, detail="No se puede modificar un turno cancelado o asistido")
 
-        turno.fecha = datos.get("fecha", turno.fecha)
-        turno.hora = datos.get("hora", turno.hora)
+        fecha_anterior = turno.fecha
+        estado_anterior = turno.estado
+        if "fecha" in datos:
+            try:
+                turno.fecha = datetime.strptime(datos["fecha"], "%Y-%m-%d").date()
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido, use YYYY-MM-DD")
+
+        if "hora" in datos:
+            try:
+                minutos = hora_a_minutos(datos["hora"])
+            except (TypeError, ValueError):
+                minutos = None
+            if minutos not in MINUTOS_VALIDOS:
+                raise HTTPException(status_code=400, detail="La hora debe estar entre 09:00 y 16:00 en intervalos de 30 minutos")
+            turno.hora = minutos
         turno.estado = datos.get("estado", turno.estado)
 
         if "persona_id" in datos:
@@ -490,15 +606,16 @@ async def modificar_turno(id: int, request: Request, db: Session = Depends(get_d
                 raise HTTPException(status_code=400, detail="Persona no encontrada")
             turno.persona_id = datos["persona_id"]
 
-        db.commit()
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha,
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
-        return resultado
+        if turno.estado == settings.ESTADO_CANCELADO and estado_anterior != settings.ESTADO_CANCELADO:
+            registrar_cancelacion(db, turno.persona_id, turno.id, turno.fecha)
+
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Esa hora no se encuentra disponible. Seleccione otra hora.")
+        cache_disponibilidad.invalidar(fecha_anterior, turno.fecha)
+        return TurnoOut.model_validate(turno)
     except HTTPException:
         raise
     except Exception as e:
@@ -516,8 +633,12 @@ def eliminar_turno(id: int, db: Session = Depends(get_db)):
         if turno.estado == settings.ESTADO_ASISTIDO:
             raise HTTPException(status_code=400, detail="No se puede eliminar un turno asistido")
 
+        fecha = turno.fecha
+        if turno.estado == settings.ESTADO_CANCELADO:
+            anular_cancelacion(db, turno.id)
         db.delete(turno)
         db.commit()
+        cache_disponibilidad.invalidar(fecha)
         return {"mensaje": "Turno eliminado"}
     except HTTPException:
         raise
@@ -527,131 +648,97 @@ def eliminar_turno(id: int, db: Session = Depends(get_db)):
 
 #Hecho por Kevin Lesama Soto
 @app.get("/turnos-disponibles")
-def turnos_disponibles(fecha: str, db: Session = Depends(get_db)):
+def turnos_disponibles(
+    fecha: Optional[str] = None,
+    desde: Optional[str] = Query(None, description="Inicio del rango (YYYY-MM-DD), alternativa a 'fecha'"),
+    hasta: Optional[str] = Query(None, description="Fin del rango (YYYY-MM-DD), inclusive"),
+    bitmask: bool = Query(False, description="Devolver cada día como máscara de bits sobre 'horarios'"),
+    db: Session = Depends(get_db)
+):
     try:
-        try:
-            fecha_dt = datetime.strptime(fecha, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
-
-        turnos_ocupados = db.query(Turnos).filter(
-            Turnos.fecha == fecha_dt,
-            Turnos.estado != settings.ESTADO_CANCELADO
-        ).all()
-
-        horarios_ocupados = {t.hora for t in turnos_ocupados}
-        horarios_libres = [h for h in settings.HORARIOS_VALIDOS if h not in horarios_ocupados]
+        if fecha is not None:
+            try:
+                fecha_dt = datetime.strptime(fecha, "%Y-%m-%d").date()
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
 
-        return {"fecha": fecha, "horarios_disponibles": horarios_libres}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener los turnos disponibles: {str(e)}")
+            horarios_ocupados = horarios_ocupados_por_dia(db, fecha_dt, fecha_dt)[fecha_dt]
 
-#Hecho por Nahuel Garcia
-@app.put("/turnos/{id}/cancelar")
-async def cancelar_turno(id: int, db: Session = Depends(get_db)):
-    try:
-        turno = db.query(Turnos).get(id)
-        if turno is None:
-            raise HTTPException(status_code=404, detail="Turno no encontrado")
+            return {"fecha": fecha, "horarios_disponibles": horarios_libres(horarios_ocupados)}
 
-        if turno.estado == settings.ESTADO_ASISTIDO:
-            raise HTTPException(status_code=400, detail="No se puede cancelar un turno asistido")
+        if not desde or not hasta:
+            raise HTTPException(status_code=400, detail="Indique 'fecha' o el rango 'desde' y 'hasta'")
 
-        if turno.estado == settings.ESTADO_CANCELADO:
-            raise HTTPException(status_code=400, detail="El turno ya está cancelado")
+        try:
+            fecha_desde = datetime.strptime(desde, "%Y-%m-%d").date()
+            fecha_hasta = datetime.strptime(hasta, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
 
-        turno.estado = settings.ESTADO_CANCELADO
-        db.commit()
-        
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha.isoformat(),
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
-        return resultado
-    except HTTPException:
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al cancelar el turno: {str(e)}")
+        if fecha_desde > fecha_hasta:
+            raise HTTPException(status_code=400, detail="La fecha 'desde' no puede ser posterior a 'hasta'")
 
-#Hecho por Kevin Lesama Soto
-@app.put("/turnos/{id}/confirmar")
-async def confirmar_turno(id: int, db: Session = Depends(get_db)):
-    try:
-        turno = db.query(Turnos).get(id)
-        if turno is None:
-            raise HTTPException(status_code=404, detail="Turno no encontrado")
+        cantidad_dias = (fecha_hasta - fecha_desde).days + 1
+        if cantidad_dias > settings.MAX_DIAS_DISPONIBILIDAD:
+            raise HTTPException(status_code=400, detail=f"El rango no puede superar {settings.MAX_DIAS_DISPONIBILIDAD} días")
 
-        if turno.estado == settings.ESTADO_ASISTIDO:
-            raise HTTPException(status_code=400, detail="No se puede confirmar un turno asistido")
+        ocupados_por_dia = horarios_ocupados_por_dia(db, fecha_desde, fecha_hasta)
 
-        if turno.estado == settings.ESTADO_CANCELADO or turno.estado == settings.ESTADO_CONFIRMADO:
-            raise HTTPException(status_code=400, detail="No se puede confirmar un turno cancelado o ya confirmado")
-        
-        turno.estado = settings.ESTADO_CONFIRMADO
-        db.commit()
+        dias = {}
+        for i in range(cantidad_dias):
+            dia = fecha_desde + timedelta(days=i)
+            horarios_ocupados = ocupados_por_dia[dia]
+            dias[dia.isoformat()] = mascara_horarios(horarios_ocupados) if bitmask else horarios_libres(horarios_ocupados)
 
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha.isoformat(),
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
+        resultado = {"desde": fecha_desde.isoformat(), "hasta": fecha_hasta.isoformat(), "dias": dias}
+        if bitmask:
+            resultado["horarios"] = settings.HORARIOS_VALIDOS
         return resultado
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al confirmar el turno: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener los turnos disponibles: {str(e)}")
 
-#Hecho por Nahuel Garcia
-@app.get("/reportes/turnos-por-fecha")
-def reportes_turnos_por_fecha(fecha: str, db: Session = Depends(get_db)):
+@app.get("/turnos-disponibles/proximos")
+def proximos_turnos_disponibles(
+    desde: Optional[str] = Query(None, description="Fecha desde la que buscar (YYYY-MM-DD), por defecto hoy"),
+    n: int = Query(5, gt=0, le=settings.MAX_PROXIMOS_TURNOS, description="Cantidad de horarios libres a devolver"),
+    db: Session = Depends(get_db)
+):
     try:
-        try:
-            fecha_dt = datetime.strptime(fecha, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha inválido, usar YYYY-MM-DD")
-
-        
-        turnos_con_persona = db.query(Turnos, Persona).join(Persona, Turnos.persona_id == Persona.id).filter(Turnos.fecha == fecha_dt).order_by(Persona.nombre, Turnos.hora).all()
-        
-        if not turnos_con_persona:
-            return {"mensaje": "No hay turnos registrados para esta fecha"}
+        ahora = datetime.now()
+        hoy = ahora.date()
+        if desde is None:
+            fecha_desde = hoy
+        else:
+            try:
+                fecha_desde = datetime.strptime(desde, "%Y-%m-%d").date()
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+            fecha_desde = max(fecha_desde, hoy)
 
-        
-        personas_agrupadas = {}
-        for turno, persona in turnos_con_persona:
-            if persona.dni not in personas_agrupadas:
-                personas_agrupadas[persona.dni] = {
-                    "persona_nombre": persona.nombre,
-                    "persona_dni": persona.dni,
-                    "turnos": []
-                }
-            
-            personas_agrupadas[persona.dni]["turnos"].append({
-                "id": turno.id,
-                "hora": turno.hora,
-                "estado": turno.estado
-            })
+        # Si se busca desde hoy no se ofrecen horarios que ya pasaron
+        desde_minutos = ahora.hour * 60 + ahora.minute if fecha_desde == hoy else 0
+        fecha_hasta = fecha_desde + timedelta(days=settings.HORIZONTE_PROXIMOS_DIAS - 1)
 
-        
-        lista_personas = list(personas_agrupadas.values())
+        turnos = proximos_horarios_libres(db, fecha_desde, fecha_hasta, n, desde_minutos)
 
-        return {"fecha": fecha, "personas": lista_personas}
+        return {"desde": fecha_desde.isoformat(), "hasta": fecha_hasta.isoformat(), "turnos": turnos}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al buscar los próximos turnos disponibles: {str(e)}")
+
+@app.get("/metricas")
+def metricas():
+    return {
+        "cache_disponibilidad": cache_disponibilidad.estadisticas(),
+        "cache_reportes": cache_reportes.estadisticas(),
+        "pdf": estadisticas_pdf()
+    }
 
 #Hecho por Nahuel Garcia
-@app.put("/turnos/{id}/cancelar")
+@app.put("/turnos/{id}/cancelar", response_model=TurnoOut)
 async def cancelar_turno(id: int, db: Session = Depends(get_db)):
     try:
         turno = db.query(Turnos).get(id)
@@ -665,16 +752,11 @@ async def cancelar_turno(id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="El turno ya está cancelado")
 
         turno.estado = settings.ESTADO_CANCELADO
+        registrar_cancelacion(db, turno.persona_id, turno.id, turno.fecha)
         db.commit()
+        cache_disponibilidad.invalidar(turno.fecha)
         
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha,
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
-        return resultado
+        return TurnoOut.model_validate(turno)
     except HTTPException:
         raise
     except Exception as e:
@@ -682,7 +764,7 @@ async def cancelar_turno(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al cancelar el turno: {str(e)}")
 
 #Hecho por Kevin Lesama Soto
-@app.put("/turnos/{id}/confirmar")
+@app.put("/turnos/{id}/confirmar", response_model=TurnoOut)
 async def confirmar_turno(id: int, db: Session = Depends(get_db)):
     try:
         turno = db.query(Turnos).get(id)
@@ -697,667 +779,604 @@ async def confirmar_turno(id: int, db: Session = Depends(get_db)):
         
         turno.estado = settings.ESTADO_CONFIRMADO
         db.commit()
+        cache_disponibilidad.invalidar(turno.fecha)
 
-        resultado = {
-            "id": turno.id,
-            "fecha": turno.fecha,
-            "hora": turno.hora,
-            "estado": turno.estado,
-            "persona_id": turno.persona_id
-        }
-        return resultado
+        return TurnoOut.model_validate(turno)
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al confirmar el turno: {str(e)}")
 
-#Hecho por Nahuel Garcia
-@app.get("/reportes/turnos-por-fecha")
-def reportes_turnos_por_fecha(fecha: str, db: Session = Depends(get_db)):
+def cachear_reporte(ruta):
+    # Guarda la respuesta ya serializada (JSON o PDF) por ruta, parametros y
+    # dia (la edad y el "mes actual" dependen de la fecha), y la reusa mientras la
+    # version de los datos no cambie. Los errores y el modo NDJSON no se guardan.
+    def buscar(request, db):
+        clave = (request.url.path, tuple(sorted(request.query_params.multi_items())), date.today())
+        version = version_datos(db)
+        return clave, version, cache_reportes.obtener(clave, version)
+
+    def responder(clave, version, guardada, respuesta=None):
+        if guardada is not None:
+            contenido, media_type, headers = guardada
+            return Response(contenido, media_type=media_type, headers=headers)
+        if isinstance(respuesta, Response) and not isinstance(respuesta, StreamingResponse):
+            headers = {k: v for k, v in respuesta.headers.items() if k == "content-disposition"}
+            cache_reportes.guardar(clave, version, (respuesta.body, respuesta.media_type, headers))
+        return respuesta
+
+    if inspect.iscoroutinefunction(ruta):
+        @wraps(ruta)
+        async def envoltura_async(*args, **kwargs):
+            clave, version, guardada = await run_in_threadpool(buscar, kwargs["request"], kwargs["db"])
+            if guardada is not None:
+                return responder(clave, version, guardada)
+            return responder(clave, version, None, await ruta(*args, **kwargs))
+        return envoltura_async
+
+    @wraps(ruta)
+    def envoltura(*args, **kwargs):
+        if pide_ndjson(kwargs["request"]):
+            return ruta(*args, **kwargs)
+        clave, version, guardada = buscar(kwargs["request"], kwargs["db"])
+        if guardada is not None:
+            return responder(clave, version, guardada)
+        return responder(clave, version, None, ruta(*args, **kwargs))
+    return envoltura
+
+#Cada reporte tiene una funcion tabla_* que valida los parametros y trae el
+#DataFrame plano de reportes.py. La ruta JSON lo agrupa por persona y lo devuelve
+#como ORJSONResponse; la de PDF lo usa directo, solo eligiendo columnas. Las de
+#CSV no arman DataFrame: recorren la consulta_* por lotes y no pasan por la cache.
+
+def parsear_fecha_reporte(fecha: str):
     try:
-        try:
-            fecha_dt = datetime.strptime(fecha, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha inválido, usar YYYY-MM-DD")
-
-        
-        turnos_con_persona = db.query(Turnos, Persona).join(Persona, Turnos.persona_id == Persona.id).filter(Turnos.fecha == fecha_dt).order_by(Persona.nombre, Turnos.hora).all()
-        
-        if not turnos_con_persona:
-            return {"mensaje": "No hay turnos registrados para esta fecha"}
-
-        
-        personas_agrupadas = {}
-        for turno, persona in turnos_con_persona:
-            if persona.dni not in personas_agrupadas:
-                personas_agrupadas[persona.dni] = {
-                    "persona_nombre": persona.nombre,
-                    "persona_dni": persona.dni,
-                    "turnos": []
-                }
-            
-            personas_agrupadas[persona.dni]["turnos"].append({
-                "id": turno.id,
-                "hora": turno.hora,
-                "estado": turno.estado
-            })
-
-        
-        lista_personas = list(personas_agrupadas.values())
-
-        return {"fecha": fecha, "personas": lista_personas}
-    except HTTPException:
-        raise
+        return datetime.strptime(fecha, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido, usar YYYY-MM-DD")
+
+def rango_turnos_confirmados(desde: str, hasta: str):
+    fecha_desde = parsear_fecha_reporte(desde)
+    fecha_hasta = parsear_fecha_reporte(hasta)
+
+    if fecha_desde > fecha_hasta:
+        raise HTTPException(status_code=400, detail="La fecha 'desde' no puede ser posterior a 'hasta'")
+    return fecha_desde, fecha_hasta
+
+def mes_actual():
+    hoy = date.today()
+    primer_dia_mes = hoy.replace(day=1)
+    if hoy.month == 12:
+        ultimo_dia_mes = hoy.replace(year=hoy.year + 1, month=1, day=1) - timedelta(days=1)
+    else:
+        ultimo_dia_mes = hoy.replace(month=hoy.month + 1, day=1) - timedelta(days=1)
+    return hoy.year, MESES_ESPANOL[hoy.month - 1], primer_dia_mes, ultimo_dia_mes
+
+def tabla_turnos_por_fecha(fecha: str, db: Session):
+    fecha_dt = parsear_fecha_reporte(fecha)
+    try:
+        return reportes.turnos_por_fecha(db, fecha_dt)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
 
-#Hecho por Orion Quimey Jaime Adell
-@app.get("/reportes/turnos-por-persona")
-def reportes_turnos_por_persona(dni: int, db: Session = Depends(get_db)):
+def tabla_turnos_por_persona(dni: int, db: Session):
     try:
         persona = db.query(Persona).filter_by(dni=dni).first()
-        
         if persona is None:
             raise HTTPException(status_code=404, detail=f"Persona con DNI {dni} no encontrada.")
-
-        turnos = db.query(Turnos).filter_by(persona_id=persona.id).all()
-
-        resultado_turnos = [
-            {
-                "id": t.id,
-                "fecha": t.fecha.isoformat(),
-                "hora": t.hora,
-                "estado": t.estado,
-            }
-            for t in turnos
-        ]
-        
-        return {
-            "dni": persona.dni,
-            "nombre": persona.nombre,
-            "turnos": resultado_turnos
-        }
+        return persona, reportes.turnos_de_persona(db, persona.id)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener los turnos por persona: {str(e)}")
-        
-#Hecho por Kevin Lesama Soto
-@app.get("/reportes/estado-personas")
-def reporte_estado_personas(habilitada: bool, db: Session = Depends(get_db)):
+
+def tabla_estado_personas(habilitada: bool, db: Session):
     try:
-        personas = db.query(Persona).filter(Persona.habilitado == habilitada).all()
-        
-        resultado = []
-        for p in personas:
-            try:
-                edad = calcular_edad(p.fecha_de_nacimiento) if p.fecha_de_nacimiento else None
-            except Exception:
-                edad = None
-            
-            resultado.append({
-                "id": p.id,
-                "dni": p.dni,
-                "nombre": p.nombre,
-                "email": p.email,
-                "telefono": p.telefono,
-                "fecha_de_nacimiento": p.fecha_de_nacimiento.isoformat() if p.fecha_de_nacimiento else None,
-                "edad": edad,
-                "habilitado": p.habilitado
-            })
-        return resultado
-    except HTTPException:
-        raise
+        return reportes.estado_personas(db, habilitada, date.today())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener el reporte: {str(e)}")
 
-#Hecho por Agustin Nicolas Mancini
-@app.get("/reportes/turnos-cancelados")
-def reportes_turnos_cancelados(min: int, db: Session = Depends(get_db)):
+def tabla_turnos_cancelados(min: int, db: Session):
     try:
-        
-        personas_con_cancelados = (
-            db.query(
-                Persona,
-                func.count(Turnos.id).label("cantidad_cancelados")
-            )
-            .join(Turnos, Persona.id == Turnos.persona_id)
-            .filter(Turnos.estado == settings.ESTADO_CANCELADO)
-            .group_by(Persona.id)
-            .having(func.count(Turnos.id) >= min)
-            .all()
-        )
+        return reportes.turnos_cancelados(db, min)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
 
-        if not personas_con_cancelados:
-            return {"mensaje": f"No hay personas con {min} o más turnos cancelados"}
-
-        resultado = []
-        for persona, cantidad in personas_con_cancelados:
-            
-            turnos_detalle = db.query(Turnos).filter(
-                Turnos.persona_id == persona.id,
-                Turnos.estado == settings.ESTADO_CANCELADO
-            ).all()
-
-            resultado.append({
-                "persona_id": persona.id,
-                "dni": persona.dni,
-                "nombre": persona.nombre,
-                "cantidad_cancelados": cantidad,
-                "turnos_cancelados": [
-                    {
-                        "id": t.id,
-                        "fecha": t.fecha.isoformat(),
-                        "hora": t.hora,
-                        "estado": t.estado
-                    }
-                    for t in turnos_detalle
-                ]
-            })
-
-        return {"minimo": min, "personas": resultado}
+def tabla_turnos_cancelados_por_mes(db: Session):
+    anio, mes, primer_dia_mes, ultimo_dia_mes = mes_actual()
+    try:
+        return anio, mes, reportes.turnos_por_estado(db, settings.ESTADO_CANCELADO, primer_dia_mes, ultimo_dia_mes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte de cancelados por mes: {str(e)}")
 
+def tabla_turnos_confirmados(desde: str, hasta: str, db: Session):
+    fecha_desde, fecha_hasta = rango_turnos_confirmados(desde, hasta)
+    try:
+        return reportes.turnos_por_estado(db, settings.ESTADO_CONFIRMADO, fecha_desde, fecha_hasta)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
 
+def consulta_estado_personas(db: Session, habilitada: bool):
+    return (
+        db.query(Persona, expresion_edad(Persona.fecha_de_nacimiento, date.today()))
+        .filter(Persona.habilitado == habilitada)
+        .order_by(Persona.id)
+    )
+
+#Hecho por Nahuel Garcia
+@app.get("/reportes/turnos-por-fecha")
+@cachear_reporte
+def reportes_turnos_por_fecha(fecha: str, request: Request, db: Session = Depends(get_db)):
+    df = tabla_turnos_por_fecha(fecha, db)
+    if df.empty:
+        return ORJSONResponse({"mensaje": "No hay turnos registrados para esta fecha"})
+    return ORJSONResponse({
+        "fecha": fecha,
+        "personas": reportes.agrupar_por_persona(
+            df, "persona_dni", ["persona_nombre", "persona_dni"], ["id", "hora", "estado"], "turnos"
+        )
+    })
+
 #Hecho por Orion Quimey Jaime Adell
 @app.get("/reportes/turnos-por-persona")
-def reportes_turnos_por_persona(dni: int, db: Session = Depends(get_db)):
-    try:
-        persona = db.query(Persona).filter_by(dni=dni).first()
-        
-        if persona is None:
-            raise HTTPException(status_code=404, detail=f"Persona con DNI {dni} no encontrada.")
-
-        turnos = db.query(Turnos).filter_by(persona_id=persona.id).all()
+@cachear_reporte
+def reportes_turnos_por_persona(dni: int, request: Request, db: Session = Depends(get_db)):
+    persona, df = tabla_turnos_por_persona(dni, db)
+    return ORJSONResponse({
+        "dni": persona.dni,
+        "nombre": persona.nombre,
+        "turnos": df.to_dict("records")
+    })
 
-        resultado_turnos = [
-            {
-                "id": t.id,
-                "fecha": t.fecha,
-                "hora": t.hora,
-                "estado": t.estado,
-            }
-            for t in turnos
-        ]
-        
-        return {
-            "dni": persona.dni,
-            "nombre": persona.nombre,
-            "turnos": resultado_turnos
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener los turnos por persona: {str(e)}")
-        
 #Hecho por Kevin Lesama Soto
 @app.get("/reportes/estado-personas")
-def reporte_estado_personas(habilitada: bool, db: Session = Depends(get_db)):
-    try:
-        personas = db.query(Persona).filter(Persona.habilitado == habilitada).all()
-        
-        resultado = []
-        for p in personas:
-            try:
-                edad = calcular_edad(p.fecha_de_nacimiento) if p.fecha_de_nacimiento else None
-            except Exception:
-                edad = None
-            
-            resultado.append({
-                "id": p.id,
-                "dni": p.dni,
-                "nombre": p.nombre,
-                "email": p.email,
-                "telefono": p.telefono,
-                "fecha_de_nacimiento": p.fecha_de_nacimiento.isoformat() if p.fecha_de_nacimiento else None,
-                "edad": edad,
-                "habilitado": p.habilitado
-            })
-        return resultado
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al obtener el reporte: {str(e)}")
+@cachear_reporte
+def reporte_estado_personas(habilitada: bool, request: Request, db: Session = Depends(get_db)):
+    if pide_ndjson(request):
+        return respuesta_ndjson(
+            lambda sesion: consulta_estado_personas(sesion, habilitada),
+            lambda fila: persona_out(*fila).model_dump()
+        )
+    return ORJSONResponse(tabla_estado_personas(habilitada, db).to_dict("records"))
 
 #Hecho por Agustin Nicolas Mancini
 @app.get("/reportes/turnos-cancelados")
-def reportes_turnos_cancelados(min: int, db: Session = Depends(get_db)):
-    try:
-        
-        personas_con_cancelados = (
-            db.query(
-                Persona,
-                func.count(Turnos.id).label("cantidad_cancelados")
-            )
-            .join(Turnos, Persona.id == Turnos.persona_id)
-            .filter(Turnos.estado == settings.ESTADO_CANCELADO)
-            .group_by(Persona.id)
-            .having(func.count(Turnos.id) >= min)
-            .all()
+@cachear_reporte
+def reportes_turnos_cancelados(min: int, request: Request, db: Session = Depends(get_db)):
+    df = tabla_turnos_cancelados(min, db)
+    if df.empty:
+        return ORJSONResponse({"mensaje": f"No hay personas con {min} o más turnos cancelados"})
+    return ORJSONResponse({
+        "minimo": min,
+        "personas": reportes.agrupar_por_persona(
+            df, "persona_id", ["persona_id", "dni", "nombre", "cantidad_cancelados"],
+            ["id", "fecha", "hora", "estado"], "turnos_cancelados"
         )
-
-        if not personas_con_cancelados:
-            return {"mensaje": f"No hay personas con {min} o más turnos cancelados"}
-
-        resultado = []
-        for persona, cantidad in personas_con_cancelados:
-            
-            turnos_detalle = db.query(Turnos).filter(
-                Turnos.persona_id == persona.id,
-                Turnos.estado == settings.ESTADO_CANCELADO
-            ).all()
-
-            resultado.append({
-                "persona_id": persona.id,
-                "dni": persona.dni,
-                "nombre": persona.nombre,
-                "cantidad_cancelados": cantidad,
-                "turnos_cancelados": [
-                    {
-                        "id": t.id,
-                        "fecha": t.fecha,
-                        "hora": t.hora,
-                        "estado": t.estado
-                    }
-                    for t in turnos_detalle
-                ]
-            })
-
-        return {"minimo": min, "personas": resultado}
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
+    })
 
 #Hecho por Orion Quimey Jaime Adell
 @app.get("/reportes/turnos-cancelados-por-mes")
-def reportes_turnos_cancelados_por_mes(db: Session = Depends(get_db)):
-    try:
-        hoy = date.today()
-        
-        primer_dia_mes = hoy.replace(day=1)
-        if hoy.month == 12:
-            ultimo_dia_mes = hoy.replace(year=hoy.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            ultimo_dia_mes = hoy.replace(month=hoy.month + 1, day=1) - timedelta(days=1)
-
-        mes_nombre_es = MESES_ESPANOL[hoy.month - 1]
-
-        turnos_con_persona = (
-            db.query(Turnos, Persona)
-            .join(Persona, Turnos.persona_id == Persona.id)
-            .filter(
-                Turnos.estado == settings.ESTADO_CANCELADO,
-                Turnos.fecha >= primer_dia_mes,
-                Turnos.fecha <= ultimo_dia_mes
-            )
-            .order_by(Persona.nombre, Turnos.fecha, Turnos.hora)
-            .all()
+@cachear_reporte
+def reportes_turnos_cancelados_por_mes(request: Request, db: Session = Depends(get_db)):
+    anio, mes, df = tabla_turnos_cancelados_por_mes(db)
+    if df.empty:
+        return ORJSONResponse({
+            "anio": anio,
+            "mes": mes,
+            "mensaje": "No hay turnos cancelados en este mes."
+        })
+    return ORJSONResponse({
+        "anio": anio,
+        "mes": mes,
+        "personas": reportes.agrupar_por_persona(
+            df, "persona_dni", ["persona_nombre", "persona_dni"],
+            ["id", "fecha", "hora", "estado"], "turnos_cancelados"
         )
-
-        if not turnos_con_persona:
-            return {
-                "anio": hoy.year,
-                "mes": mes_nombre_es,
-                "mensaje": "No hay turnos cancelados en este mes."
-            }
-
-        personas_agrupadas = {}
-        for turno, persona in turnos_con_persona:
-            if persona.dni not in personas_agrupadas:
-                personas_agrupadas[persona.dni] = {
-                    "persona_nombre": persona.nombre,
-                    "persona_dni": persona.dni,
-                    "turnos_cancelados": []
-                }
-            
-            personas_agrupadas[persona.dni]["turnos_cancelados"].append({
-                "id": turno.id,
-                "fecha": turno.fecha.isoformat(),
-                "hora": turno.hora,
-                "estado": turno.estado
-            })
-
-        lista_personas = list(personas_agrupadas.values())
-
-        return {
-            "anio": hoy.year,
-            "mes": mes_nombre_es,
-            "personas": lista_personas
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte de cancelados por mes: {str(e)}")
-
-
+    })
 
 #Hecho por Agustin Nicolas Mancini
 @app.get("/reportes/turnos-confirmados")
-def reportes_turnos_confirmados(desde: str, hasta: str, db: Session = Depends(get_db)):
-    try:
-        try:
-            fecha_desde = datetime.strptime(desde, "%Y-%m-%d").date()
-            fecha_hasta = datetime.strptime(hasta, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha inválido, usar YYYY-MM-DD")
-
-        if fecha_desde > fecha_hasta:
-            raise HTTPException(status_code=400, detail="La fecha 'desde' no puede ser posterior a 'hasta'")
-
-        
-        turnos_con_persona = db.query(Turnos, Persona).join(Persona, Turnos.persona_id == Persona.id).filter(
-            Turnos.estado == settings.ESTADO_CONFIRMADO,
-            Turnos.fecha >= fecha_desde,
-            Turnos.fecha <= fecha_hasta
-        ).order_by(Persona.nombre, Turnos.fecha, Turnos.hora).all()
-
-        if not turnos_con_persona:
-            return {"mensaje": "No hay turnos confirmados en el rango de fechas especificado"}
-
-        
-        personas_agrupadas = {}
-        for turno, persona in turnos_con_persona:
-            if persona.dni not in personas_agrupadas:
-                personas_agrupadas[persona.dni] = {
-                    "persona_nombre": persona.nombre,
-                    "persona_dni": persona.dni,
-                    "turnos": []
-                }
-            
-            personas_agrupadas[persona.dni]["turnos"].append({
-                "id": turno.id,
-                "fecha": turno.fecha.isoformat(), 
-                "hora": turno.hora,
-                "estado": turno.estado
-            })
-
-        
-        lista_personas = list(personas_agrupadas.values())
-
-        return {
-            "desde": fecha_desde.isoformat(),
-            "hasta": fecha_hasta.isoformat(),
-            "personas": lista_personas
-        }
+@cachear_reporte
+def reportes_turnos_confirmados(desde: str, hasta: str, request: Request, db: Session = Depends(get_db)):
+    if pide_ndjson(request):
+        # Una linea por turno, en orden de fecha y hora: asi la consulta recorre el
+        # indice (fecha, hora, estado) y no tiene que ordenar todo el rango antes
+        # de mandar la primera fila.
+        fecha_desde, fecha_hasta = rango_turnos_confirmados(desde, hasta)
+        return respuesta_ndjson(
+            lambda sesion: sesion.query(
+                Turnos.id, Turnos.fecha, Turnos.hora, Turnos.estado, Persona.dni, Persona.nombre
+            ).join(Persona, Turnos.persona_id == Persona.id).filter(
+                Turnos.estado == settings.ESTADO_CONFIRMADO,
+                Turnos.fecha >= fecha_desde,
+                Turnos.fecha <= fecha_hasta
+            ).order_by(Turnos.fecha, Turnos.hora),
+            lambda fila: {
+                "id": fila.id,
+                "fecha": fila.fecha,
+                "hora": minutos_a_hora(fila.hora),
+                "estado": fila.estado,
+                "persona_dni": fila.dni,
+                "persona_nombre": fila.nombre
+            }
+        )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocurrió un error al generar el reporte: {str(e)}")
+    df = tabla_turnos_confirmados(desde, hasta, db)
+    if df.empty:
+        return ORJSONResponse({"mensaje": "No hay turnos confirmados en el rango de fechas especificado"})
+    return ORJSONResponse({
+        "desde": parsear_fecha_reporte(desde).isoformat(),
+        "hasta": parsear_fecha_reporte(hasta).isoformat(),
+        "personas": reportes.agrupar_por_persona(
+            df, "persona_dni", ["persona_nombre", "persona_dni"],
+            ["id", "fecha", "hora", "estado"], "turnos"
+        )
+    })
 
 #hecho por kevin soto lesama
 @app.get("/reportes/pdf/turnos-por-fecha")
-def pdf_turnos_por_fecha(fecha: str, db: Session = Depends(get_db)):
-    data = reportes_turnos_por_fecha(fecha, db)
-    
-    if isinstance(data, dict) and "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-        
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Hora": t["hora"],
-                "Estado": t["estado"]
-            })
-            
-    df = pd.DataFrame(filas)
-    pdf = generar_pdf_borb(df, f"Turnos del día {fecha}")
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": f"inline; filename=turnos_{fecha}.pdf"})
+@cachear_reporte
+async def pdf_turnos_por_fecha(fecha: str, request: Request, db: Session = Depends(get_db)):
+    df = await run_in_threadpool(tabla_turnos_por_fecha, fecha, db)
+
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No hay turnos registrados para esta fecha")
+
+    df = reportes.columnas_exportacion(df, {"persona_dni": "DNI", "persona_nombre": "Nombre", "hora": "Hora", "estado": "Estado"})
+    return await generar_pdf_response(request, df, f"Turnos del día {fecha}", f"inline; filename=turnos_{fecha}.pdf")
 
 
 #hecho por kevin soto lesama
 @app.get("/reportes/pdf/turnos-por-persona")
-def pdf_turnos_por_persona(dni: int, db: Session = Depends(get_db)):
-    data = reportes_turnos_por_persona(dni, db)
-    
-    filas = []
-    for t in data["turnos"]:
-        filas.append({
-            "Fecha": t["fecha"],
-            "Hora": t["hora"],
-            "Estado": t["estado"]
-        })
-        
-    if not filas:
+@cachear_reporte
+async def pdf_turnos_por_persona(dni: int, request: Request, db: Session = Depends(get_db)):
+    persona, df = await run_in_threadpool(tabla_turnos_por_persona, dni, db)
+
+    if df.empty:
         raise HTTPException(status_code=404, detail="La persona no tiene turnos.")
-        
-    df = pd.DataFrame(filas)
-    pdf = generar_pdf_borb(df, f"Turnos de {data['nombre']} (DNI: {data['dni']})")
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": f"inline; filename=turnos_persona_{dni}.pdf"})
+
+    df = reportes.columnas_exportacion(df, {"fecha": "Fecha", "hora": "Hora", "estado": "Estado"})
+    return await generar_pdf_response(request, df, f"Turnos de {persona.nombre} (DNI: {persona.dni})", f"inline; filename=turnos_persona_{dni}.pdf")
 
 
 #hecho por kevin soto lesama
 @app.get("/reportes/pdf/estado-personas")
-def pdf_estado_personas(habilitada: bool, db: Session = Depends(get_db)):
-    lista_personas = reporte_estado_personas(habilitada, db)
-    
-    if not lista_personas:
+@cachear_reporte
+async def pdf_estado_personas(habilitada: bool, request: Request, db: Session = Depends(get_db)):
+    df = await run_in_threadpool(tabla_estado_personas, habilitada, db)
+
+    if df.empty:
         estado = "habilitadas" if habilitada else "inhabilitadas"
         raise HTTPException(status_code=404, detail=f"No hay personas {estado}")
-        
-    df = pd.DataFrame(lista_personas)
-    
-    cols_a_mostrar = ["dni", "nombre", "email", "telefono", "edad"]
-    cols_finales = [c for c in cols_a_mostrar if c in df.columns]
-    df = df[cols_finales]
-    
+
+    df = df[["dni", "nombre", "email", "telefono", "edad"]]
+
     estado_str = "Habilitadas" if habilitada else "Inhabilitadas"
-    pdf = generar_pdf_borb(df, f"Personas {estado_str}")
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": f"inline; filename=personas_{estado_str}.pdf"})
+    return await generar_pdf_response(request, df, f"Personas {estado_str}", f"inline; filename=personas_{estado_str}.pdf")
 
 
 #Hecho por Nahuel Garcia
 @app.get("/reportes/pdf/turnos-cancelados")
-def pdf_turnos_cancelados(min: int, db: Session = Depends(get_db)):
-    data = reportes_turnos_cancelados(min, db)
-    
-    if "mensaje" in data:
-         raise HTTPException(status_code=404, detail=data["mensaje"])
-         
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos_cancelados"]:
-            filas.append({
-                "DNI": p["dni"],
-                "Nombre": p["nombre"],
-                "Cant. Total": p["cantidad_cancelados"],
-                "Fecha Turno": t["fecha"],
-                "Estado": t["estado"]
-            })
-            
-    df = pd.DataFrame(filas)
-    pdf = generar_pdf_borb(df, f"Personas con +{min} cancelaciones")
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": f"inline; filename=cancelados_min_{min}.pdf"})
+@cachear_reporte
+async def pdf_turnos_cancelados(min: int, request: Request, db: Session = Depends(get_db)):
+    df = await run_in_threadpool(tabla_turnos_cancelados, min, db)
+
+    if df.empty:
+         raise HTTPException(status_code=404, detail=f"No hay personas con {min} o más turnos cancelados")
+
+    df = reportes.columnas_exportacion(df, {
+        "dni": "DNI",
+        "nombre": "Nombre",
+        "cantidad_cancelados": "Cant. Total",
+        "fecha": "Fecha Turno",
+        "estado": "Estado"
+    })
+    return await generar_pdf_response(request, df, f"Personas con +{min} cancelaciones", f"inline; filename=cancelados_min_{min}.pdf")
 
 
 #Hecho por Nahuel Garcia
 @app.get("/reportes/pdf/turnos-cancelados-por-mes")
-def pdf_turnos_cancelados_por_mes(db: Session = Depends(get_db)):
-    data = reportes_turnos_cancelados_por_mes(db)
-    
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-        
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos_cancelados"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Fecha": t["fecha"],
-                "Hora": t["hora"]
-            })
-            
-    df = pd.DataFrame(filas)
-    titulo = f"Cancelados: {data['mes']} {data['anio']}"
-    pdf = generar_pdf_borb(df, titulo)
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=cancelados_mes.pdf"})
+@cachear_reporte
+async def pdf_turnos_cancelados_por_mes(request: Request, db: Session = Depends(get_db)):
+    anio, mes, df = await run_in_threadpool(tabla_turnos_cancelados_por_mes, db)
+
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No hay turnos cancelados en este mes.")
+
+    df = reportes.columnas_exportacion(df, {"persona_dni": "DNI", "persona_nombre": "Nombre", "fecha": "Fecha", "hora": "Hora"})
+    titulo = f"Cancelados: {mes} {anio}"
+    return await generar_pdf_response(request, df, titulo, "inline; filename=cancelados_mes.pdf")
 
 
 #Hecho por Nahuel Garcia
 @app.get("/reportes/pdf/turnos-confirmados")
-def pdf_turnos_confirmados(desde: str, hasta: str, db: Session = Depends(get_db)):
-    data = reportes_turnos_confirmados(desde, hasta, db)
-    
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-        
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Fecha": t["fecha"],
-                "Hora": t["hora"]
-            })
-            
-    df = pd.DataFrame(filas)
-    pdf = generar_pdf_borb(df, f"Confirmados: {desde} al {hasta}")
-    return StreamingResponse(pdf, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=confirmados.pdf"})
+@cachear_reporte
+async def pdf_turnos_confirmados(desde: str, hasta: str, request: Request, db: Session = Depends(get_db)):
+    df = await run_in_threadpool(tabla_turnos_confirmados, desde, hasta, db)
 
-#Hecho por Agustin Nicolás Mancini
-@app.get("/reportes/csv/turnos-por-fecha")
-def csv_turnos_por_fecha(fecha: str, db: Session = Depends(get_db)):
-    data = reportes_turnos_por_fecha(fecha, db)
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No hay turnos confirmados en el rango de fechas especificado")
 
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
+    df = reportes.columnas_exportacion(df, {"persona_dni": "DNI", "persona_nombre": "Nombre", "fecha": "Fecha", "hora": "Hora"})
+    return await generar_pdf_response(request, df, f"Confirmados: {desde} al {hasta}", "inline; filename=confirmados.pdf")
 
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Hora": t["hora"],
-                "Estado": t["estado"]
-            })
+#Hecho por Agustin Nicolás Mancini
+@app.get("/reportes/csv/turnos-por-fecha")
+def csv_turnos_por_fecha(fecha: str, request: Request, db: Session = Depends(get_db)):
+    fecha_dt = parsear_fecha_reporte(fecha)
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_turnos_por_fecha(fecha_dt),
+        {"persona_dni": "DNI", "persona_nombre": "Nombre", "hora": "Hora", "estado": "Estado"},
+        f"turnos_{fecha}.csv"
+    )
 
-    df = pd.DataFrame(filas)
-    return generar_csv_response(df, f"turnos_{fecha}.csv")
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="No hay turnos registrados para esta fecha")
+    return respuesta
 
 #Hecho por Agustin Nicolás Mancini
 @app.get("/reportes/csv/turnos-cancelados-por-mes")
-def csv_turnos_cancelados_por_mes(db: Session = Depends(get_db)):
-    data = reportes_turnos_cancelados_por_mes(db)
-
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos_cancelados"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Fecha": t["fecha"],
-                "Hora": t["hora"]
-            })
-
-    df = pd.DataFrame(filas)
-    nombre = f"cancelados_{data['mes']}_{data['anio']}.csv"
-    return generar_csv_response(df, nombre)
+def csv_turnos_cancelados_por_mes(request: Request, db: Session = Depends(get_db)):
+    anio, mes, primer_dia_mes, ultimo_dia_mes = mes_actual()
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_turnos_por_estado(settings.ESTADO_CANCELADO, primer_dia_mes, ultimo_dia_mes),
+        {"persona_dni": "DNI", "persona_nombre": "Nombre", "fecha": "Fecha", "hora": "Hora"},
+        f"cancelados_{mes}_{anio}.csv"
+    )
+
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="No hay turnos cancelados en este mes.")
+    return respuesta
 
 #Hecho por Agustin Nicolás Mancini
 @app.get("/reportes/csv/turnos-cancelados")
-def csv_turnos_cancelados(min: int, db: Session = Depends(get_db)):
-    data = reportes_turnos_cancelados(min, db)
-
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos_cancelados"]:
-            filas.append({
-                "DNI": p["dni"],
-                "Nombre": p["nombre"],
-                "Cantidad Cancelados": p["cantidad_cancelados"],
-                "Fecha": t["fecha"],
-                "Hora": t["hora"]
-            })
+def csv_turnos_cancelados(min: int, request: Request, db: Session = Depends(get_db)):
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_turnos_cancelados(min),
+        {
+            "dni": "DNI",
+            "nombre": "Nombre",
+            "cantidad_cancelados": "Cantidad Cancelados",
+            "fecha": "Fecha",
+            "hora": "Hora"
+        },
+        f"cancelados_min_{min}.csv"
+    )
 
-    df = pd.DataFrame(filas)
-    return generar_csv_response(df, f"cancelados_min_{min}.csv")
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail=f"No hay personas con {min} o más turnos cancelados")
+    return respuesta
 
 
 #Hecho por Orion Quimey Jaime Adell
 @app.get("/reportes/csv/turnos-por-persona")
-def csv_turnos_por_persona(dni: int, db: Session = Depends(get_db)):
-    data = reportes_turnos_por_persona(dni, db)
-    
-    filas = []
-    for t in data["turnos"]:
-        filas.append({
-            "Fecha": t["fecha"],
-            "Hora": t["hora"],
-            "Estado": t["estado"]
-        })
-        
-    if not filas:
-        raise HTTPException(status_code=404, detail="La persona no tiene turnos.")
-        
-    df = pd.DataFrame(filas)
-    csv_content = df.to_csv(index=False, sep=",")
-    
-    return StreamingResponse(
-        iter([csv_content]), 
-        media_type="text/csv", 
-        headers={"Content-Disposition": f"attachment; filename=turnos_persona_{dni}.csv"}
+def csv_turnos_por_persona(dni: int, request: Request, db: Session = Depends(get_db)):
+    persona = db.query(Persona).filter_by(dni=dni).first()
+    if persona is None:
+        raise HTTPException(status_code=404, detail=f"Persona con DNI {dni} no encontrada.")
+
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_turnos_de_persona(persona.id),
+        {"fecha": "Fecha", "hora": "Hora", "estado": "Estado"},
+        f"turnos_persona_{dni}.csv"
     )
 
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="La persona no tiene turnos.")
+    return respuesta
+
 #Hecho por Orion Quimey Jaime Adell
 @app.get("/reportes/csv/estado-personas")
-def csv_estado_personas(habilitada: bool, db: Session = Depends(get_db)):
-    lista_personas = reporte_estado_personas(habilitada, db)
-    
-    if not lista_personas:
-        estado = "habilitadas" if habilitada else "inhabilitadas"
-        raise HTTPException(status_code=404, detail=f"No hay personas {estado}")
-        
-    df = pd.DataFrame(lista_personas)
-    
-    
-    cols_a_mostrar = ["dni", "nombre", "email", "telefono", "edad"]
-    cols_finales = [c for c in cols_a_mostrar if c in df.columns]
-    df = df[cols_finales]
-    
+def csv_estado_personas(habilitada: bool, request: Request, db: Session = Depends(get_db)):
     estado_str = "Habilitadas" if habilitada else "Inhabilitadas"
-    csv_content = df.to_csv(index=False, sep=",")
-    
-    return StreamingResponse(
-        iter([csv_content]), 
-        media_type="text/csv", 
-        headers={"Content-Disposition": f"attachment; filename=personas_{estado_str}.csv"}
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_estado_personas(habilitada, date.today()),
+        {"dni": "dni", "nombre": "nombre", "email": "email", "telefono": "telefono", "edad": "edad"},
+        f"personas_{estado_str}.csv"
     )
-    
+
+    if respuesta is None:
+        estado = "habilitadas" if habilitada else "inhabilitadas"
+        raise HTTPException(status_code=404, detail=f"No hay personas {estado}")
+    return respuesta
+
 #Hecho por Orion Quimey Jaime Adell
 @app.get("/reportes/csv/turnos-confirmados")
-def csv_turnos_confirmados(desde: str, hasta: str, db: Session = Depends(get_db)):
-    data = reportes_turnos_confirmados(desde, hasta, db)
-    
-    if "mensaje" in data:
-        raise HTTPException(status_code=404, detail=data["mensaje"])
-        
-    filas = []
-    for p in data["personas"]:
-        for t in p["turnos"]:
-            filas.append({
-                "DNI": p["persona_dni"],
-                "Nombre": p["persona_nombre"],
-                "Fecha": t["fecha"],
-                "Hora": t["hora"]
-            })
-            
-    df = pd.DataFrame(filas)
-    csv_content = df.to_csv(index=False, sep=",")
-    
-    return StreamingResponse(
-        iter([csv_content]), 
-        media_type="text/csv", 
-        headers={"Content-Disposition": "attachment; filename=confirmados.csv"}
-    )
\ No newline at end of file
+def csv_turnos_confirmados(desde: str, hasta: str, request: Request, db: Session = Depends(get_db)):
+    fecha_desde, fecha_hasta = rango_turnos_confirmados(desde, hasta)
+    respuesta = generar_csv_response(
+        request,
+        reportes.consulta_turnos_por_estado(settings.ESTADO_CONFIRMADO, fecha_desde, fecha_hasta),
+        {"persona_dni": "DNI", "persona_nombre": "Nombre", "fecha": "Fecha", "hora": "Hora"},
+        "confirmados.csv"
+    )
+
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="No hay turnos confirmados en el rango de fechas especificado")
+    return respuesta
+
+
+#Las mismas consultas en Parquet y Arrow IPC, con columnas tipadas (fechas como
+#date, dni como entero), para levantarlas sin parsear texto. Cada formato tiene
+#su ruta, que solo le pasa el formato a la funcion columnar_* del reporte.
+def columnar_turnos_por_fecha(formato: str, fecha: str):
+    fecha_dt = parsear_fecha_reporte(fecha)
+    respuesta = generar_columnar_response(formato, reportes.consulta_turnos_por_fecha(fecha_dt), f"turnos_{fecha}")
+
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="No hay turnos registrados para esta fecha")
+    return respuesta
+
+def columnar_turnos_confirmados(formato: str, desde: str, hasta: str):
+    fecha_desde, fecha_hasta = rango_turnos_confirmados(desde, hasta)
+    respuesta = generar_columnar_response(
+        formato,
+        reportes.consulta_turnos_por_estado(settings.ESTADO_CONFIRMADO, fecha_desde, fecha_hasta),
+        "confirmados"
+    )
+
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="No hay turnos confirmados en el rango de fechas especificado")
+    return respuesta
+
+def columnar_turnos_cancelados(formato: str, min: int):
+    respuesta = generar_columnar_response(formato, reportes.consulta_turnos_cancelados(min), f"cancelados_min_{min}")
+
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail=f"No hay personas con {min} o más turnos cancelados")
+    return respuesta
+
+def columnar_estado_personas(formato: str, habilitada: bool):
+    estado_str = "Habilitadas" if habilitada else "Inhabilitadas"
+    respuesta = generar_columnar_response(
+        formato,
+        reportes.consulta_estado_personas(habilitada, date.today()),
+        f"personas_{estado_str}"
+    )
+
+    if respuesta is None:
+        estado = "habilitadas" if habilitada else "inhabilitadas"
+        raise HTTPException(status_code=404, detail=f"No hay personas {estado}")
+    return respuesta
+
+@app.get("/reportes/parquet/turnos-por-fecha")
+def parquet_turnos_por_fecha(fecha: str, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_por_fecha("parquet", fecha)
+
+@app.get("/reportes/arrow/turnos-por-fecha")
+def arrow_turnos_por_fecha(fecha: str, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_por_fecha("arrow", fecha)
+
+@app.get("/reportes/parquet/turnos-confirmados")
+def parquet_turnos_confirmados(desde: str, hasta: str, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_confirmados("parquet", desde, hasta)
+
+@app.get("/reportes/arrow/turnos-confirmados")
+def arrow_turnos_confirmados(desde: str, hasta: str, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_confirmados("arrow", desde, hasta)
+
+@app.get("/reportes/parquet/turnos-cancelados")
+def parquet_turnos_cancelados(min: int, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_cancelados("parquet", min)
+
+@app.get("/reportes/arrow/turnos-cancelados")
+def arrow_turnos_cancelados(min: int, request: Request, db: Session = Depends(get_db)):
+    return columnar_turnos_cancelados("arrow", min)
+
+@app.get("/reportes/parquet/estado-personas")
+def parquet_estado_personas(habilitada: bool, request: Request, db: Session = Depends(get_db)):
+    return columnar_estado_personas("parquet", habilitada)
+
+@app.get("/reportes/arrow/estado-personas")
+def arrow_estado_personas(habilitada: bool, request: Request, db: Session = Depends(get_db)):
+    return columnar_estado_personas("arrow", habilitada)
+
+
+#Reportes en segundo plano: se reusan las mismas rutas de /reportes (con su cache),
+#llamadas desde el executor de trabajos.py con una sesion propia.
+RUTAS_REPORTES = {r.path: r.endpoint for r in app.routes if getattr(r, "path", "").startswith("/reportes/")}
+FORMATOS_REPORTE = ("json", "csv", "pdf", "parquet", "arrow")
+
+def validar_parametros_reporte(endpoint, parametros: dict):
+    # Convierte los parametros con los tipos de la ruta (como haria FastAPI con la query)
+    validados = {}
+    for nombre, parametro in inspect.signature(endpoint).parameters.items():
+        if nombre in ("request", "db"):
+            continue
+        if nombre not in parametros:
+            raise HTTPException(status_code=400, detail=f"Falta el parámetro '{nombre}'")
+        try:
+            validados[nombre] = TypeAdapter(parametro.annotation).validate_python(parametros[nombre])
+        except ValidationError:
+            raise HTTPException(status_code=400, detail=f"El parámetro '{nombre}' es inválido")
+    return validados
+
+async def leer_cuerpo(respuesta: StreamingResponse) -> bytes:
+    return b"".join([parte async for parte in respuesta.body_iterator])
+
+def generar_reporte(ruta: str, endpoint, parametros: dict, nombre_json: str):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("trabajos", 0),
+        "path": ruta,
+        "root_path": "",
+        "query_string": urlencode(parametros).encode(),
+        "headers": [],
+        "state": {"trabajo": True}
+    }
+    db = SessionLocal()
+    try:
+        respuesta = endpoint(**parametros, request=Request(scope), db=db)
+        if inspect.iscoroutine(respuesta):
+            respuesta = asyncio.run(respuesta)
+    finally:
+        db.close()
+
+    if isinstance(respuesta, StreamingResponse):
+        cuerpo = asyncio.run(leer_cuerpo(respuesta))
+    else:
+        cuerpo = respuesta.body
+    disposicion = respuesta.headers.get("content-disposition", "")
+    nombre_archivo = disposicion.split("filename=")[-1] if "filename=" in disposicion else nombre_json
+    return cuerpo, respuesta.media_type, nombre_archivo
+
+@app.post("/reportes/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def crear_trabajo_reporte(request: Request):
+    try:
+        datos = await request.json()
+        reporte = datos.get("reporte")
+        formato = datos.get("formato", "pdf")
+        parametros = datos.get("parametros") or {}
+
+        if formato not in FORMATOS_REPORTE:
+            raise HTTPException(status_code=400, detail="El formato debe ser json, csv, pdf, parquet o arrow")
+        if not isinstance(parametros, dict):
+            raise HTTPException(status_code=400, detail="'parametros' debe ser un objeto")
+
+        ruta = f"/reportes/{reporte}" if formato == "json" else f"/reportes/{formato}/{reporte}"
+        endpoint = RUTAS_REPORTES.get(ruta)
+        if endpoint is None:
+            raise HTTPException(status_code=404, detail=f"No existe el reporte '{reporte}' en formato {formato}")
+        parametros = validar_parametros_reporte(endpoint, parametros)
+
+        id = trabajos_reportes.crear(
+            {"reporte": reporte, "formato": formato, "parametros": datos.get("parametros") or {}},
+            lambda: generar_reporte(ruta, endpoint, parametros, f"{reporte}.json")
+        )
+        if id is None:
+            raise HTTPException(status_code=503, detail="Hay demasiados reportes en cola, intente más tarde")
+        return {"id": id, "estado": trabajos_reportes.estado(id)["estado"]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error al crear el trabajo: {str(e)}")
+
+@app.get("/reportes/jobs/{id}")
+def estado_trabajo_reporte(id: str):
+    estado = trabajos_reportes.estado(id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    if estado["estado"] == ESTADO_TERMINADO:
+        estado["descarga"] = f"/reportes/jobs/{id}/download"
+    return estado
+
+@app.get("/reportes/jobs/{id}/download")
+def descargar_trabajo_reporte(id: str):
+    estado = trabajos_reportes.estado(id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    if estado["estado"] != ESTADO_TERMINADO:
+        raise HTTPException(status_code=409, detail=f"El trabajo todavía no terminó (estado: {estado['estado']})")
+
+    archivo = trabajos_reportes.archivo(id)
+    if not archivo.exists():
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    return FileResponse(archivo, media_type=estado["media_type"], filename=estado["nombre_archivo"])
@@ -0,0 +1,166 @@
+from sqlalchemy import inspect, text, Integer, MetaData
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import Session
+from models import Base, Turnos, Persona, Cancelacion
+from config import settings
+from utils import inicio_ventana_cancelaciones, recalcular_cancelaciones, minutos_a_hora
+
+#Migraciones que se corren al iniciar la app sobre bases ya existentes (mi_base.bd).
+#Cada una revisa el esquema antes de tocar nada, asi que se pueden correr siempre.
+
+def _reconstruir_tabla(conn, tabla, select_sql: str):
+    # Orden que documenta SQLite para cambiar una tabla: crear la nueva con otro
+    # nombre, copiar, borrar la vieja y renombrar la nueva. Renombrar primero la
+    # vieja reescribiria las FOREIGN KEY de las demas tablas hacia el nombre temporal.
+    # Las demas tablas se copian al MetaData solo para que se resuelvan las FOREIGN KEY.
+    metadata = MetaData()
+    for otra in Base.metadata.sorted_tables:
+        if otra is not tabla:
+            otra.to_metadata(metadata)
+    nueva = tabla.to_metadata(metadata, name=f"{tabla.name}_nueva")
+    conn.execute(CreateTable(nueva))
+    columnas = ", ".join(c.name for c in tabla.columns)
+    conn.execute(text(f"INSERT INTO {nueva.name} ({columnas}) {select_sql}"))
+    conn.execute(text(f"DROP TABLE {tabla.name}"))
+    conn.execute(text(f"ALTER TABLE {nueva.name} RENAME TO {tabla.name}"))
+
+
+def migrar_hora_a_minutos(engine):
+    # Turnos.hora paso de "HH:MM" a minutos desde medianoche. SQLite no permite
+    # cambiar el tipo de una columna, asi que se reconstruye la tabla.
+    columnas = {c["name"]: c["type"] for c in inspect(engine).get_columns("turnos")}
+    if "hora" not in columnas or isinstance(columnas["hora"], Integer):
+        return
+
+    with engine.begin() as conn:
+        _reconstruir_tabla(conn, Turnos.__table__, (
+            "SELECT id, fecha, "
+            "CAST(substr(hora, 1, instr(hora, ':') - 1) AS INTEGER) * 60 "
+            "+ CAST(substr(hora, instr(hora, ':') + 1) AS INTEGER), "
+            "estado, persona_id FROM turnos"
+        ))
+    print("AVISO: Se migró turnos.hora a minutos desde medianoche.")
+
+
+def migrar_contador_cancelaciones(engine):
+    # Agrega personas.cancelaciones_recientes y carga el registro de cancelaciones
+    # con los turnos cancelados que siguen dentro de la ventana. Solo carga el
+    # contador: el contador arranca en 0, asi que recalcular no toca habilitado.
+    columnas = {c["name"] for c in inspect(engine).get_columns("personas")}
+    if "cancelaciones_recientes" in columnas:
+        return
+
+    with Session(engine) as session:
+        session.execute(text("ALTER TABLE personas ADD COLUMN cancelaciones_recientes INTEGER DEFAULT 0"))
+        cancelados = session.query(Turnos.persona_id, Turnos.id, Turnos.fecha).filter(
+            Turnos.estado == settings.ESTADO_CANCELADO,
+            Turnos.fecha >= inicio_ventana_cancelaciones(),
+            Turnos.persona_id.isnot(None)
+        ).all()
+        session.add_all([
+            Cancelacion(persona_id=persona_id, turno_id=turno_id, fecha=fecha)
+            for persona_id, turno_id, fecha in cancelados
+        ])
+        session.flush()
+        recalcular_cancelaciones(session, [id for (id,) in session.query(Persona.id)])
+        session.commit()
+    print("AVISO: Se agregó el contador de cancelaciones a personas.")
+
+
+def crear_conteos(engine, tablas=("personas", "turnos")):
+    # Los triggers corren dentro de cada INSERT/DELETE, asi que el conteo es exacto
+    # aunque escriban varios workers o se inserte en bloque.
+    with engine.begin() as conn:
+        for tabla in tablas:
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS conteo_{tabla}_insert AFTER INSERT ON {tabla} "
+                f"BEGIN UPDATE conteos SET filas = filas + 1 WHERE tabla = '{tabla}'; END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS conteo_{tabla}_delete AFTER DELETE ON {tabla} "
+                f"BEGIN UPDATE conteos SET filas = filas - 1 WHERE tabla = '{tabla}'; END"
+            ))
+            conn.execute(text(
+                f"INSERT OR IGNORE INTO conteos (tabla, filas) SELECT '{tabla}', COUNT(*) FROM {tabla}"
+            ))
+
+
+def crear_version_datos(engine, tablas=("personas", "turnos")):
+    # Cualquier INSERT, UPDATE o DELETE en estas tablas incrementa la version; la
+    # cache de reportes la compara para saber si un resultado guardado sigue valiendo.
+    with engine.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO version_datos (id, version) VALUES (1, 0)"))
+        for tabla in tablas:
+            for evento in ("insert", "update", "delete"):
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS version_{tabla}_{evento} AFTER {evento.upper()} ON {tabla} "
+                    f"BEGIN UPDATE version_datos SET version = version + 1 WHERE id = 1; END"
+                ))
+
+
+def crear_busqueda_personas(engine):
+    # Indice FTS5 sobre nombre y email con la tabla personas como contenido externo;
+    # los triggers lo mantienen al crear, modificar y borrar. Devuelve False si el
+    # SQLite instalado no trae FTS5.
+    try:
+        with engine.begin() as conn:
+            existe = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'personas_fts'"
+            )).first()
+            if not existe:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE personas_fts USING fts5("
+                    "nombre, email, content='personas', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                ))
+                conn.execute(text("INSERT INTO personas_fts(personas_fts) VALUES ('rebuild')"))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS personas_fts_insert AFTER INSERT ON personas BEGIN "
+                "INSERT INTO personas_fts(rowid, nombre, email) VALUES (new.id, new.nombre, new.email); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS personas_fts_delete AFTER DELETE ON personas BEGIN "
+                "INSERT INTO personas_fts(personas_fts, rowid, nombre, email) "
+                "VALUES ('delete', old.id, old.nombre, old.email); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS personas_fts_update AFTER UPDATE OF nombre, email ON personas BEGIN "
+                "INSERT INTO personas_fts(personas_fts, rowid, nombre, email) "
+                "VALUES ('delete', old.id, old.nombre, old.email); "
+                "INSERT INTO personas_fts(rowid, nombre, email) VALUES (new.id, new.nombre, new.email); END"
+            ))
+        return True
+    except OperationalError as e:
+        print(f"AVISO: No se pudo crear la búsqueda FTS5 de personas ({e}), se usará LIKE.")
+        return False
+
+
+def turnos_activos_duplicados(engine):
+    # Antes del indice unico de turnos activos, la base podia quedar con dos turnos
+    # activos en el mismo horario. Devuelve "fecha hora: ids" por cada horario repetido.
+    with engine.connect() as conn:
+        filas = conn.execute(text(
+            "SELECT fecha, hora, group_concat(id, ', ') FROM turnos "
+            "WHERE estado != :cancelado GROUP BY fecha, hora HAVING COUNT(*) > 1 "
+            "ORDER BY fecha, hora"
+        ), {"cancelado": settings.ESTADO_CANCELADO}).all()
+    return [f"{fecha} {minutos_a_hora(hora)}: {ids}" for fecha, hora, ids in filas]
+
+
+def crear_indices(engine):
+    # create_all no agrega indices nuevos a tablas que ya existen en mi_base.bd
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            try:
+                indice.create(bind=engine, checkfirst=True)
+            except IntegrityError:
+                if indice.name == "ux_turnos_fecha_hora_activo":
+                    # Las reservas dependen de este indice para no pisarse: sin el
+                    # la app no puede arrancar. Cual turno queda lo decide un operador.
+                    duplicados = "; ".join(turnos_activos_duplicados(engine))
+                    raise RuntimeError(
+                        f"No se pudo crear '{indice.name}', hay turnos activos en el mismo horario "
+                        f"(ids por horario: {duplicados}). Cancele los que sobran y vuelva a iniciar."
+                    )
+                print(f"AVISO: No se pudo crear '{indice.name}', hay datos duplicados en '{tabla.name}'.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from base import Base
 from config import settings
@@ -7,12 +7,14 @@ from config import settings
 class Persona(Base):
     __tablename__ = "personas"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    dni = Column(Integer)
+    dni = Column(Integer, unique=True, index=True)
     nombre = Column(String)
-    email = Column(String)
-    telefono = Column(Integer)
+    email = Column(String, unique=True, index=True)
+    telefono = Column(Integer, unique=True, index=True)
     fecha_de_nacimiento = Column(Date)
     habilitado = Column(Boolean, default=True)
+    # Cantidad de filas en cancelaciones para la persona, mantenida al cancelar
+    cancelaciones_recientes = Column(Integer, default=0)
     turnos = relationship("Turnos", back_populates="persona")
 
 #Hecho por Kevin Lesama Soto
@@ -20,7 +22,41 @@ class Turnos(Base):
     __tablename__ = "turnos"
     id = Column(Integer, primary_key=True, autoincrement=True)
     fecha = Column(Date, nullable=False)
-    hora = Column(String)
+    hora = Column(Integer)  # minutos desde medianoche
     estado = Column(String, default=settings.ESTADO_PENDIENTE)
     persona_id = Column(Integer, ForeignKey('personas.id'))
-    persona = relationship("Persona", back_populates="turnos")
\ No newline at end of file
+    persona = relationship("Persona", back_populates="turnos")
+
+    __table_args__ = (
+        Index("ix_turnos_fecha_hora_estado", "fecha", "hora", "estado"),
+        # Un solo turno activo por horario: la base rechaza la reserva duplicada
+        # aunque dos pedidos lleguen a la vez desde distintos workers.
+        Index(
+            "ux_turnos_fecha_hora_activo", "fecha", "hora",
+            unique=True,
+            sqlite_where=text(f"estado != '{settings.ESTADO_CANCELADO}'")
+        ),
+    )
+
+#Registro de cancelaciones dentro de la ventana de DIAS_VENTANA_CANCELACIONES.
+#La fecha es la del turno cancelado; las filas vencidas las borra la depuracion periodica.
+class Cancelacion(Base):
+    __tablename__ = "cancelaciones"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    persona_id = Column(Integer, ForeignKey('personas.id'), nullable=False)
+    turno_id = Column(Integer, ForeignKey('turnos.id'), index=True)
+    fecha = Column(Date, nullable=False, index=True)
+
+
+#Cantidad de filas por tabla, mantenida por triggers de SQLite (ver migraciones.crear_conteos)
+class Conteo(Base):
+    __tablename__ = "conteos"
+    tabla = Column(String, primary_key=True)
+    filas = Column(Integer, nullable=False, default=0)
+
+#Version de los datos: una sola fila que los triggers de SQLite incrementan con
+#cada cambio en personas o turnos (ver migraciones.crear_version_datos)
+class VersionDatos(Base):
+    __tablename__ = "version_datos"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,347 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from math import ceil
+from multiprocessing import get_context
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from PIL import Image as PILImage
+from borb.pdf.document import Document
+from borb.pdf.page.page import Page
+from borb.pdf.pdf import PDF
+from borb.pdf.canvas.layout.text.paragraph import Paragraph
+from borb.pdf.canvas.layout.table.fixed_column_width_table import FixedColumnWidthTable
+from borb.pdf.canvas.layout.page_layout.multi_column_layout import SingleColumnLayout
+from borb.pdf.canvas.color.color import HexColor
+from borb.pdf.canvas.layout.layout_element import Alignment
+from borb.pdf.canvas.layout.table.table import TableCell
+from borb.pdf.canvas.layout.image.image import Image
+from borb.pdf.canvas.font.simple_font.font_type_1 import StandardType1Font
+from config import settings
+
+#Generacion de PDFs con borb. El armado y PDF.dumps son Python puro y usan mucha
+#CPU, asi que corren en un pool de procesos aparte: el proceso de la API solo
+#manda la tabla ya serializada (columnas, filas y titulo) y espera los bytes.
+
+MUESTRA_ANCHOS = 50
+MARGEN = Decimal(40)
+# Tamaño de Page() por defecto en borb (A4, en puntos)
+ANCHO_PAGINA = 595
+ALTO_PAGINA = 842
+# Interlineado que usa borb cuando no se le pasa uno
+INTERLINEADO = 1.2
+# Lugar para el pie y el espacio que borb deja entre elementos
+RESERVA_PAGINA = 60
+
+_fuentes = {}
+
+def fuente(nombre: str) -> StandardType1Font:
+    # borb vuelve a leer las metricas (AFM) de la fuente por cada Paragraph que
+    # recibe el nombre como texto; se cargan una vez por proceso y se reusan.
+    if nombre not in _fuentes:
+        _fuentes[nombre] = StandardType1Font(nombre)
+    return _fuentes[nombre]
+
+_plantilla = None
+
+def obtener_plantilla() -> dict:
+    # Lo que se repite en todos los PDFs (logo decodificado y fuentes del titulo,
+    # la fecha y el pie) se prepara una vez por proceso, al arrancar el pool.
+    # Se mide solo la decodificacion del logo, que antes se repetia en cada render.
+    global _plantilla
+    if _plantilla is None:
+        ruta_logo = Path("logo_unla.png")
+        logo = None
+        segundos_logo = 0.0
+        if ruta_logo.exists():
+            inicio = perf_counter()
+            logo = PILImage.open(ruta_logo)
+            logo.load()
+            segundos_logo = perf_counter() - inicio
+        else:
+            print("AVISO: No se encontró 'logo_unla.png'.")
+        for nombre in ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique"):
+            fuente(nombre)
+        _plantilla = {"logo": logo, "segundos_logo": segundos_logo}
+    return _plantilla
+
+_anchos_letras = {}
+
+def ancho_texto(texto: str, nombre_fuente: str, tamanio: float) -> float:
+    # Ancho en puntos segun las metricas de la fuente; el ancho de cada letra se
+    # guarda porque borb lo busca recorriendo toda la tabla de la fuente.
+    anchos = _anchos_letras.setdefault(nombre_fuente, {})
+    total = 0.0
+    for letra in texto:
+        if letra not in anchos:
+            f = fuente(nombre_fuente)
+            anchos[letra] = float(f.get_width(f.unicode_to_character_identifier(letra) or 0) or 0)
+        total += anchos[letra]
+    return total * tamanio / 1000
+
+
+def lineas_de_texto(texto: str, ancho: float, nombre_fuente: str, tamanio: float) -> int:
+    # Cuantas lineas ocupa el texto en una celda, cortando por palabras como Paragraph
+    lineas = 0
+    actual = ""
+    for palabra in texto.split():
+        prueba = f"{actual} {palabra}" if actual else palabra
+        if actual and ancho_texto(prueba, nombre_fuente, tamanio) > ancho:
+            lineas += 1
+            actual = palabra
+        else:
+            actual = prueba
+    return lineas + 1
+
+
+def alto_fila(valores: list, anchos_celdas: list, nombre_fuente: str, tamanio: float, relleno: float) -> float:
+    lineas = max(lineas_de_texto(str(v), a, nombre_fuente, tamanio) for v, a in zip(valores, anchos_celdas))
+    # borb redondea hacia arriba el alto del texto de cada celda
+    return ceil(lineas * tamanio * INTERLINEADO) + relleno
+
+
+def cortar_en_paginas(alto_encabezado: float, altos: list, espacio_primera: float, espacio: float) -> list:
+    # Reparte las filas en bloques (inicio, fin) que entren en el alto disponible de
+    # cada pagina, contando el encabezado que se repite. Al menos una fila por
+    # bloque, y como mucho FILAS_POR_PAGINA_PDF.
+    bloques = []
+    inicio = 0
+    disponible = espacio_primera
+    while inicio < len(altos):
+        fin = inicio
+        usado = alto_encabezado
+        while fin < len(altos) and fin - inicio < settings.FILAS_POR_PAGINA_PDF:
+            if fin > inicio and usado + altos[fin] > disponible:
+                break
+            usado += altos[fin]
+            fin += 1
+        bloques.append((inicio, fin))
+        inicio = fin
+        disponible = espacio
+    return bloques
+
+
+def anchos_de_columnas(columnas: list, filas: list) -> list:
+    # Ancho relativo de cada columna segun el texto mas largo entre el encabezado
+    # y las primeras MUESTRA_ANCHOS filas, acotado para que ninguna se coma la pagina.
+    largos = [len(str(c)) for c in columnas]
+    for fila in filas[:MUESTRA_ANCHOS]:
+        largos = [max(largo, len(str(valor))) for largo, valor in zip(largos, fila)]
+    return [Decimal(min(max(largo, 4), 30)) for largo in largos]
+
+
+#Hecho por Kevin Soto Lesama
+def generar_pdf_borb(columnas: list, filas: list, titulo: str) -> bytes:
+    try:
+        pdf = Document()
+        page = Page()
+        pdf.append_page(page)
+        
+        layout = SingleColumnLayout(page, 
+                                    vertical_margin=MARGEN, 
+                                    horizontal_margin=MARGEN)
+        
+        plantilla = obtener_plantilla()
+        if plantilla["logo"] is not None:
+            # Copia para que borb no comparta el mismo objeto entre documentos
+            layout.add(Image(
+                plantilla["logo"].copy(),
+                width=Decimal(80),   
+                height=Decimal(80), 
+                horizontal_alignment=Alignment.CENTERED,
+                margin_bottom=Decimal(10)
+            ))
+
+        layout.add(Paragraph(
+            titulo, 
+            font=fuente("Helvetica-Bold"), 
+            font_size=20, 
+            horizontal_alignment=Alignment.CENTERED,
+            padding_bottom=Decimal(5)
+        ))
+        
+        fecha_emision = datetime.now().strftime("%d/%m/%Y %H:%M")
+        emitido = Paragraph(
+            f"Emitido el: {fecha_emision}", 
+            font=fuente("Helvetica-Oblique"), 
+            font_size=10, 
+            horizontal_alignment=Alignment.CENTERED,
+            padding_bottom=Decimal(20)
+        )
+        layout.add(emitido)
+
+        num_cols = len(columnas)
+        if num_cols == 0:
+            layout.add(Paragraph("No hay datos para mostrar."))
+            buffer = BytesIO()
+            PDF.dumps(buffer, pdf)
+            return buffer.getvalue()
+
+        # Una tabla de ancho fijo por pagina, con el encabezado repetido. Cada bloque
+        # arranca su propia pagina (borb no corta una tabla que no entra en el
+        # espacio que queda), asi que las filas se reparten segun el alto que va a
+        # ocupar cada una con su texto ya cortado en lineas. Los anchos se
+        # calculan una vez para todas.
+        filas = [[str(item) for item in row] for row in filas]
+        anchos = anchos_de_columnas(columnas, filas)
+        ancho_tabla = ANCHO_PAGINA - 2 * float(MARGEN)
+        anchos_celdas = [ancho_tabla * float(a / sum(anchos)) - 5 for a in anchos]
+        alto_encabezado = alto_fila(columnas, anchos_celdas, "Helvetica-Bold", 10, 10)
+        altos = [alto_fila(row, anchos_celdas, "Helvetica", 9, 8) for row in filas]
+        espacio_primera = float(emitido.get_bounding_box().get_y() - MARGEN) - RESERVA_PAGINA
+        espacio = ALTO_PAGINA - 2 * float(MARGEN) - RESERVA_PAGINA
+        for numero, (inicio, fin) in enumerate(cortar_en_paginas(alto_encabezado, altos, espacio_primera, espacio)):
+            bloque = filas[inicio:fin]
+            if numero > 0:
+                page = Page()
+                pdf.append_page(page)
+                layout = SingleColumnLayout(page,
+                                            vertical_margin=MARGEN,
+                                            horizontal_margin=MARGEN)
+            table = FixedColumnWidthTable(number_of_columns=num_cols, number_of_rows=len(bloque) + 1, column_widths=anchos)
+
+            for col in columnas:
+                table.add(TableCell(
+                    Paragraph(str(col), font=fuente("Helvetica-Bold"), font_color=HexColor("FFFFFF"), font_size=10),
+                    background_color=HexColor("585858"),
+                    padding_top=Decimal(5),
+                    padding_bottom=Decimal(5),
+                    padding_left=Decimal(5)
+                ))
+
+            for i, row in enumerate(bloque, start=inicio):
+                bg_color = HexColor("FFFFFF") if i % 2 == 0 else HexColor("F2F2F2")
+                for item in row:
+                    table.add(TableCell(
+                        Paragraph(item, font=fuente("Helvetica"), font_size=9),
+                        background_color=bg_color,
+                        padding_top=Decimal(4),
+                        padding_bottom=Decimal(4),
+                        padding_left=Decimal(5)
+                    ))
+
+            layout.add(table)
+        
+        layout.add(Paragraph(
+            "\nUniversidad Nacional de Lanús - Sistema de Turnos",
+            font=fuente("Helvetica"),
+            font_size=8,
+            font_color=HexColor("808080"),
+            horizontal_alignment=Alignment.CENTERED,
+            padding_top=Decimal(20)
+        ))
+        
+        buffer = BytesIO()
+        PDF.dumps(buffer, pdf)
+        return buffer.getvalue()
+
+    except Exception as e:
+        # Se propaga para que la ruta responda con un error HTTP: un PDF que solo
+        # dice "Error" con estado 200 quedaba guardado en la cache de reportes.
+        print(f"Error generando PDF: {e}")
+        raise
+    
+    
+
+
+class PdfOcupado(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = Lock()
+_en_curso = 0
+_estadisticas = {"renders": 0, "segundos_render": 0.0, "segundos_ahorrados_logo_estimado": 0.0}
+
+
+def _generar_en_proceso(columnas: list, filas: list, titulo: str):
+    # Corre en el proceso del pool. Devuelve junto con el PDF lo que tardo y una
+    # estimacion de lo ahorrado: el tiempo medido de la unica decodificacion del
+    # logo de este proceso, que sin la plantilla se pagaba en cada render.
+    ahorro = _plantilla["segundos_logo"] if _plantilla is not None else 0.0
+    inicio = perf_counter()
+    contenido = generar_pdf_borb(columnas, filas, titulo)
+    return contenido, perf_counter() - inicio, ahorro
+
+
+def _obtener_pool():
+    # Los procesos se crean con 'spawn' para no copiar con fork los hilos y las
+    # conexiones abiertas de la API; cada uno solo importa este modulo.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PROCESOS_PDF,
+                mp_context=get_context("spawn"),
+                initializer=obtener_plantilla
+            )
+        return _pool
+
+
+def _liberar(_futuro):
+    global _en_curso
+    with _pool_lock:
+        _en_curso -= 1
+
+
+async def renderizar_pdf(columnas: list, filas: list, titulo: str, trabajo: bool = False) -> bytes:
+    # Como mucho MAX_PDF_EN_CURSO PDFs entre los que se estan armando y los que
+    # esperan un proceso libre; pasado ese limite se rechaza con PdfOcupado.
+    # Los de /reportes/jobs (trabajo=True) no cuentan para ese limite, ya que
+    # tienen su propia cola, y esperan hasta TIMEOUT_PDF_TRABAJOS_SEGUNDOS.
+    global _en_curso
+    if not trabajo:
+        with _pool_lock:
+            if _en_curso >= settings.MAX_PDF_EN_CURSO:
+                raise PdfOcupado()
+            _en_curso += 1
+    try:
+        futuro = _obtener_pool().submit(_generar_en_proceso, columnas, filas, titulo)
+    except Exception as e:
+        if not trabajo:
+            _liberar(None)
+        if isinstance(e, BrokenProcessPool):
+            cerrar_pool()
+        raise
+    if not trabajo:
+        futuro.add_done_callback(_liberar)
+    timeout = settings.TIMEOUT_PDF_TRABAJOS_SEGUNDOS if trabajo else settings.TIMEOUT_PDF_SEGUNDOS
+    try:
+        contenido, segundos, ahorro = await asyncio.wait_for(asyncio.wrap_future(futuro), timeout=timeout)
+    except asyncio.TimeoutError:
+        # Si todavia no empezo se saca de la cola; si ya esta corriendo, el proceso
+        # termina igual y el resultado se descarta.
+        futuro.cancel()
+        raise
+    except BrokenProcessPool:
+        # Un proceso murio (por ejemplo, sin memoria): el pool queda inservible y se
+        # crea uno nuevo en el proximo pedido.
+        cerrar_pool()
+        raise
+    with _pool_lock:
+        _estadisticas["renders"] += 1
+        _estadisticas["segundos_render"] += segundos
+        _estadisticas["segundos_ahorrados_logo_estimado"] += ahorro
+    return contenido
+
+
+def estadisticas() -> dict:
+    with _pool_lock:
+        return {
+            "renders": _estadisticas["renders"],
+            "en_curso": _en_curso,
+            "segundos_render": round(_estadisticas["segundos_render"], 3),
+            "segundos_ahorrados_logo_estimado": round(_estadisticas["segundos_ahorrados_logo_estimado"], 3)
+        }
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,134 @@
+import pandas as pd
+from sqlalchemy import select, func, String, type_coerce
+from models import Persona, Turnos
+from config import settings
+from utils import expresion_edad, expresion_hora
+
+#Capa de datos de los reportes: cada funcion hace una sola consulta y devuelve
+#un DataFrame plano, una fila por turno (o por persona), con fecha y hora ya
+#como texto. El JSON agrupa ese resultado por persona y el PDF lo usa tal cual.
+#Las consultas (consulta_*) quedan aparte para que el CSV las recorra por lotes.
+
+def _fecha(columna):
+    # Las fechas se guardan como 'YYYY-MM-DD': se leen como texto, sin pasar a date
+    return type_coerce(columna, String)
+
+
+def leer(db, consulta) -> pd.DataFrame:
+    # Equivale a pd.read_sql, que con pandas 3 exige una version de SQLAlchemy
+    # mas nueva que la de requirements.txt. Las columnas quedan como object para
+    # que un NULL siga siendo None y los enteros no pasen a float (104.0).
+    resultado = db.execute(consulta)
+    return pd.DataFrame(resultado.all(), columns=list(resultado.keys()), dtype=object)
+
+
+def consulta_turnos_por_fecha(fecha):
+    return (select(
+        Turnos.id,
+        expresion_hora(Turnos.hora).label("hora"),
+        Turnos.estado,
+        Persona.dni.label("persona_dni"),
+        Persona.nombre.label("persona_nombre")
+    ).join(Persona, Turnos.persona_id == Persona.id)
+     .where(Turnos.fecha == fecha)
+     .order_by(Persona.nombre, Turnos.hora))
+
+
+def turnos_por_fecha(db, fecha) -> pd.DataFrame:
+    return leer(db, consulta_turnos_por_fecha(fecha))
+
+
+def consulta_turnos_de_persona(persona_id):
+    return (select(
+        Turnos.id,
+        _fecha(Turnos.fecha).label("fecha"),
+        expresion_hora(Turnos.hora).label("hora"),
+        Turnos.estado
+    ).where(Turnos.persona_id == persona_id)
+     .order_by(Turnos.id))
+
+
+def turnos_de_persona(db, persona_id) -> pd.DataFrame:
+    return leer(db, consulta_turnos_de_persona(persona_id))
+
+
+def consulta_estado_personas(habilitada, hoy):
+    return (select(
+        Persona.id,
+        Persona.dni,
+        Persona.nombre,
+        Persona.email,
+        Persona.telefono,
+        _fecha(Persona.fecha_de_nacimiento).label("fecha_de_nacimiento"),
+        expresion_edad(Persona.fecha_de_nacimiento, hoy),
+        Persona.habilitado
+    ).where(Persona.habilitado == habilitada)
+     .order_by(Persona.id))
+
+
+def estado_personas(db, habilitada, hoy) -> pd.DataFrame:
+    return leer(db, consulta_estado_personas(habilitada, hoy))
+
+
+def consulta_turnos_cancelados(minimo):
+    # Cada turno cancelado trae el total de cancelados de su persona (COUNT como
+    # funcion de ventana) y se filtra por ese total afuera.
+    cancelados = select(
+        Turnos.id,
+        _fecha(Turnos.fecha).label("fecha"),
+        Turnos.hora,
+        Turnos.estado,
+        Turnos.persona_id,
+        func.count().over(partition_by=Turnos.persona_id).label("cantidad_cancelados")
+    ).where(Turnos.estado == settings.ESTADO_CANCELADO).subquery()
+
+    return (select(
+        cancelados.c.id,
+        cancelados.c.fecha,
+        expresion_hora(cancelados.c.hora).label("hora"),
+        cancelados.c.estado,
+        cancelados.c.persona_id,
+        Persona.dni,
+        Persona.nombre,
+        cancelados.c.cantidad_cancelados
+    ).join(Persona, Persona.id == cancelados.c.persona_id)
+     .where(cancelados.c.cantidad_cancelados >= minimo)
+     .order_by(Persona.id, cancelados.c.id))
+
+
+def turnos_cancelados(db, minimo) -> pd.DataFrame:
+    return leer(db, consulta_turnos_cancelados(minimo))
+
+
+def consulta_turnos_por_estado(estado, desde, hasta):
+    return (select(
+        Turnos.id,
+        _fecha(Turnos.fecha).label("fecha"),
+        expresion_hora(Turnos.hora).label("hora"),
+        Turnos.estado,
+        Persona.dni.label("persona_dni"),
+        Persona.nombre.label("persona_nombre")
+    ).join(Persona, Turnos.persona_id == Persona.id)
+     .where(Turnos.estado == estado, Turnos.fecha >= desde, Turnos.fecha <= hasta)
+     .order_by(Persona.nombre, Turnos.fecha, Turnos.hora))
+
+
+def turnos_por_estado(db, estado, desde, hasta) -> pd.DataFrame:
+    return leer(db, consulta_turnos_por_estado(estado, desde, hasta))
+
+
+def agrupar_por_persona(df: pd.DataFrame, clave: str, columnas_persona, columnas_turno, lista: str):
+    # Arma la forma anidada del JSON ({persona..., lista: [turnos]}) en una pasada
+    # sobre el DataFrame, respetando el orden de la consulta. Las filas con la clave
+    # en NULL forman su propio grupo, no se descartan.
+    personas = []
+    for _, grupo in df.groupby(clave, sort=False, dropna=False):
+        persona = grupo[columnas_persona].iloc[:1].to_dict("records")[0]
+        persona[lista] = grupo[columnas_turno].to_dict("records")
+        personas.append(persona)
+    return personas
+
+
+def columnas_exportacion(df: pd.DataFrame, encabezados: dict) -> pd.DataFrame:
+    # Selecciona y renombra columnas para CSV/PDF sin copiar filas a mano
+    return df[list(encabezados)].rename(columns=encabezados)
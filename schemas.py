@@ -0,0 +1,65 @@
+from datetime import date
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, field_validator
+from utils import minutos_a_hora
+
+#Modelos de respuesta: se arman directo desde las filas del ORM (from_attributes)
+#y FastAPI los serializa con pydantic antes de pasarlos a ORJSONResponse.
+
+class PersonaOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    dni: Optional[int] = None
+    nombre: Optional[str] = None
+    email: Optional[str] = None
+    telefono: Optional[int] = None
+    fecha_de_nacimiento: Optional[date] = None
+    edad: Optional[int] = None
+    habilitado: Optional[bool] = None
+
+
+class TurnoOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    fecha: Optional[date] = None
+    hora: Optional[str] = None
+    estado: Optional[str] = None
+    persona_id: Optional[int] = None
+
+    @field_validator("hora", mode="before")
+    @classmethod
+    def hora_desde_minutos(cls, valor):
+        return minutos_a_hora(valor) if isinstance(valor, int) else valor
+
+
+class PaginaPersonas(BaseModel):
+    total: Optional[int] = None
+    skip: Optional[int] = None
+    after_id: Optional[int] = None
+    limit: int
+    next_cursor: Optional[int] = None
+    data: List[PersonaOut]
+
+
+class PaginaTurnos(BaseModel):
+    total: Optional[int] = None
+    skip: Optional[int] = None
+    after_id: Optional[int] = None
+    limit: int
+    next_cursor: Optional[int] = None
+    data: List[TurnoOut]
+
+
+class BusquedaPersonas(BaseModel):
+    q: str
+    skip: int
+    limit: int
+    data: List[PersonaOut]
+
+
+def persona_out(persona, edad=None):
+    resultado = PersonaOut.model_validate(persona)
+    resultado.edad = edad
+    return resultado
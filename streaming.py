@@ -0,0 +1,213 @@
+import csv
+import zlib
+from io import StringIO
+from itertools import chain
+import orjson
+from fastapi.responses import StreamingResponse
+from database import SessionLocal
+from config import settings
+
+#Modo NDJSON (Accept: application/x-ndjson) para listados y reportes grandes:
+#una linea JSON por fila, leyendo la consulta de a TAMANIO_LOTE_STREAMING filas.
+#Los CSV de /reportes/csv se mandan igual, sin pasar por pandas.
+
+NDJSON = "application/x-ndjson"
+TAMANIO_BLOQUE_CSV = 64 * 1024
+
+
+def pide_ndjson(request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def respuesta_ndjson(armar_consulta, convertir):
+    # armar_consulta recibe una sesion y devuelve la consulta a recorrer. El
+    # generador abre su propia sesion porque la de Depends(get_db) ya esta
+    # cerrada cuando StreamingResponse empieza a mandar el cuerpo.
+    def generar():
+        db = SessionLocal()
+        try:
+            for fila in armar_consulta(db).yield_per(settings.TAMANIO_LOTE_STREAMING):
+                yield orjson.dumps(convertir(fila)) + b"\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(generar(), media_type=NDJSON)
+
+
+def _abrir_consulta(consulta):
+    # Ejecuta el select con una sesion propia (la cierra el generador al terminar)
+    # y lee la primera fila antes de responder. Si no hay filas devuelve None.
+    db = SessionLocal()
+    try:
+        resultado = db.execute(consulta.execution_options(yield_per=settings.TAMANIO_LOTE_STREAMING))
+        primera = resultado.fetchone()
+    except Exception:
+        db.close()
+        raise
+    if primera is None:
+        db.close()
+        return None
+    return db, resultado, primera
+
+
+def pide_gzip(request) -> bool:
+    # Accept-Encoding es una lista "codificacion;q=valor"; q=0 la rechaza
+    # explicitamente. Si gzip no aparece vale lo que diga "*".
+    calidades = {}
+    for parte in request.headers.get("accept-encoding", "").split(","):
+        codificacion, _, parametros = parte.partition(";")
+        calidad = 1.0
+        for parametro in parametros.split(";"):
+            nombre, _, valor = parametro.partition("=")
+            if nombre.strip().lower() == "q":
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        calidades[codificacion.strip().lower()] = calidad
+    return calidades.get("gzip", calidades.get("*", 0.0)) > 0
+
+
+def respuesta_csv(request, consulta, encabezados: dict, filename: str):
+    # consulta es un select (los consulta_* de reportes.py) que se recorre con una
+    # sesion propia; se escriben las columnas de 'encabezados' (columna -> titulo)
+    # en bloques de TAMANIO_BLOQUE_CSV, comprimidos con gzip si el cliente lo acepta.
+    # Devuelve None si la consulta no trae filas, para que la ruta conteste 404.
+    abierta = _abrir_consulta(consulta)
+    if abierta is None:
+        return None
+    db, resultado, primera = abierta
+
+    claves = list(resultado.keys())
+    indices = [claves.index(columna) for columna in encabezados]
+    compresor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if pide_gzip(request) else None
+
+    def generar():
+        try:
+            buffer = StringIO()
+            escritor = csv.writer(buffer, lineterminator="\n")
+            escritor.writerow(encabezados.values())
+            for fila in chain([primera], resultado):
+                escritor.writerow([fila[i] for i in indices])
+                if buffer.tell() >= TAMANIO_BLOQUE_CSV:
+                    bloque = buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+                    yield compresor.compress(bloque) if compresor else bloque
+            bloque = buffer.getvalue().encode("utf-8")
+            yield compresor.compress(bloque) + compresor.flush() if compresor else bloque
+        finally:
+            db.close()
+
+    headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if compresor:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(generar(), media_type="text/csv", headers=headers)
+
+
+#Parquet y Arrow IPC (stream) para /reportes/parquet y /reportes/arrow. pyarrow es
+#opcional: se importa recien al pedir uno de estos formatos.
+
+FORMATOS_COLUMNARES = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+COLUMNAS_FECHA = {"fecha", "fecha_de_nacimiento"}
+COLUMNAS_ENTERAS = {"id", "persona_id", "dni", "persona_dni", "telefono", "edad", "cantidad_cancelados"}
+
+
+def importar_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+class _Salida:
+    # Archivo de solo escritura donde pyarrow va dejando lo que escribe; el
+    # generador lo vacia despues de cada lote y lo manda al cliente.
+    closed = False
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _columna_arrow(pa, nombre: str, valores: list):
+    # Las consultas traen fecha y hora como texto (para JSON y CSV); aca vuelven a
+    # ser date32 y time32, y los numeros enteros quedan como int64.
+    if nombre in COLUMNAS_FECHA:
+        return pa.array(valores, pa.string()).cast(pa.date32())
+    if nombre == "hora":
+        segundos = [None if v is None else int(v[:2]) * 3600 + int(v[3:5]) * 60 for v in valores]
+        return pa.array(segundos, pa.int32()).cast(pa.time32("s"))
+    if nombre in COLUMNAS_ENTERAS:
+        return pa.array(valores, pa.int64())
+    if nombre == "habilitado":
+        return pa.array(valores, pa.bool_())
+    return pa.array(valores, pa.string())
+
+
+def respuesta_columnar(consulta, formato: str, nombre: str):
+    # Recorre la consulta por lotes de TAMANIO_LOTE_STREAMING filas y escribe cada
+    # lote como un row group (Parquet) o un record batch (Arrow) apenas se lee.
+    # Devuelve None si la consulta no trae filas.
+    pa = importar_pyarrow()
+    abierta = _abrir_consulta(consulta)
+    if abierta is None:
+        return None
+    db, resultado, primera = abierta
+    columnas = list(resultado.keys())
+    media_type, extension = FORMATOS_COLUMNARES[formato]
+
+    def lote_arrow(filas):
+        return pa.record_batch(
+            [_columna_arrow(pa, columna, [fila[i] for fila in filas]) for i, columna in enumerate(columnas)],
+            names=columnas
+        )
+
+    def generar():
+        try:
+            salida = _Salida()
+            lote = lote_arrow([primera] + resultado.fetchmany(settings.TAMANIO_LOTE_STREAMING - 1))
+            if formato == "parquet":
+                escritor = pa.parquet.ParquetWriter(salida, lote.schema, compression="zstd")
+            else:
+                escritor = pa.ipc.new_stream(salida, lote.schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+            escritor.write_batch(lote)
+            yield salida.vaciar()
+            for filas in resultado.partitions():
+                escritor.write_batch(lote_arrow(filas))
+                yield salida.vaciar()
+            escritor.close()
+            yield salida.vaciar()
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generar(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={nombre}.{extension}"}
+    )
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from config import settings
+
+#Trabajos de reportes en segundo plano (POST /reportes/jobs). El estado y el
+#resultado de cada trabajo se guardan en disco, en DIRECTORIO_TRABAJOS, asi que
+#cualquier worker puede responder el estado o la descarga. Pasado el TTL se borran.
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_EN_PROCESO = "en_proceso"
+ESTADO_TERMINADO = "terminado"
+ESTADO_ERROR = "error"
+
+
+class TrabajosReportes:
+    def __init__(self, directorio: str, max_trabajos: int, max_en_cola: int, ttl_minutos: int):
+        self.directorio = Path(directorio)
+        self.max_en_cola = max_en_cola
+        self.ttl_segundos = ttl_minutos * 60
+        self.en_cola = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_trabajos, thread_name_prefix="reportes")
+        self._lock = Lock()
+
+    def _ruta(self, id: str, extension: str) -> Path:
+        return self.directorio / f"{id}.{extension}"
+
+    def _guardar_estado(self, id: str, estado: dict):
+        # Se escribe a un temporal y se renombra para que nadie lea un JSON a medias
+        temporal = self._ruta(id, "json.tmp")
+        temporal.write_text(json.dumps(estado), encoding="utf-8")
+        os.replace(temporal, self._ruta(id, "json"))
+
+    def crear(self, descripcion: dict, generar):
+        # generar() corre en el executor y devuelve (contenido, media_type, nombre_archivo).
+        # Devuelve el id, o None si ya hay max_en_cola trabajos esperando.
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.depurar()
+        with self._lock:
+            if self.en_cola >= self.max_en_cola:
+                return None
+            self.en_cola += 1
+
+        id = uuid.uuid4().hex
+        estado = dict(descripcion, id=id, estado=ESTADO_PENDIENTE, creado=datetime.now().isoformat(timespec="seconds"))
+        self._guardar_estado(id, estado)
+        self._executor.submit(self._ejecutar, id, estado, generar)
+        return id
+
+    def _ejecutar(self, id: str, estado: dict, generar):
+        try:
+            self._guardar_estado(id, dict(estado, estado=ESTADO_EN_PROCESO))
+            contenido, media_type, nombre_archivo = generar()
+            self._ruta(id, "bin").write_bytes(contenido)
+            estado = dict(estado, estado=ESTADO_TERMINADO, media_type=media_type, nombre_archivo=nombre_archivo)
+        except Exception as e:
+            estado = dict(
+                estado,
+                estado=ESTADO_ERROR,
+                codigo=getattr(e, "status_code", 500),
+                error=getattr(e, "detail", str(e))
+            )
+        finally:
+            with self._lock:
+                self.en_cola -= 1
+        self._guardar_estado(id, dict(estado, terminado=datetime.now().isoformat(timespec="seconds")))
+
+    def estado(self, id: str):
+        try:
+            return json.loads(self._ruta(id, "json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def archivo(self, id: str) -> Path:
+        return self._ruta(id, "bin")
+
+    def depurar(self):
+        # Borra estado y resultado de los trabajos mas viejos que el TTL
+        if not self.directorio.exists():
+            return
+        limite = time.time() - self.ttl_segundos
+        for archivo in self.directorio.iterdir():
+            try:
+                if archivo.stat().st_mtime < limite:
+                    archivo.unlink()
+            except OSError:
+                pass
+
+
+trabajos_reportes = TrabajosReportes(
+    directorio=settings.DIRECTORIO_TRABAJOS,
+    max_trabajos=settings.MAX_TRABAJOS_REPORTES,
+    max_en_cola=settings.MAX_TRABAJOS_EN_COLA,
+    ttl_minutos=settings.TTL_TRABAJOS_MINUTOS
+)
@@ -1,5 +1,9 @@
 from datetime import datetime, date, timedelta
-from models import Turnos
+from sqlalchemy import func, case, select, or_, and_, cast, Integer, Float, text
+import re
+from models import Persona, Turnos, Cancelacion, Conteo, VersionDatos
+from config import settings
+from cache import cache_disponibilidad
 
 #Hecho por Nahuel Garcia y Agustin Nicolas Mancini
 def calcular_edad(fecha_nacimiento):
@@ -13,41 +17,242 @@ def calcular_edad(fecha_nacimiento):
     hoy = date.today()
     return hoy.year - fecha_nac.year - ((hoy.month, hoy.day) < (fecha_nac.month, fecha_nac.day))
 
-#Hecho por Agustin Nicolas Mancini
-def turnoDisponible(session, fecha, hora):
-    try:
-        horaInicio = datetime.strptime(hora, "%H:%M")
-    except ValueError:
-        return False
-    
-    horaFin = horaInicio + timedelta(minutes=30)
+def expresion_edad(columna, hoy):
+    # Edad calculada por SQLite para toda la columna: (AAAAMMDD de hoy - AAAAMMDD de
+    # nacimiento) / 10000 con division entera. 'hoy' se calcula una vez por pedido.
+    hoy_numero = hoy.year * 10000 + hoy.month * 100 + hoy.day
+    return ((hoy_numero - cast(func.strftime("%Y%m%d", columna), Integer)) // 10000).label("edad")
 
-    turnos = session.query(Turnos).filter(Turnos.fecha == fecha).all()
+# Turnos.hora se guarda como minutos desde medianoche; "HH:MM" solo en la API
+def hora_a_minutos(hora):
+    hora_dt = datetime.strptime(hora, "%H:%M")
+    return hora_dt.hour * 60 + hora_dt.minute
 
-    for t in turnos:
-        tInicio = datetime.strptime(t.hora, "%H:%M")
-        tFin = tInicio + timedelta(minutes=30)
+def minutos_a_hora(minutos):
+    if minutos is None:
+        return None
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
 
-        if (horaInicio < tFin and horaFin > tInicio):
-            return False
-    return True
+def expresion_hora(columna):
+    # minutos_a_hora hecho por SQLite, para reportes que leen columnas enteras
+    return func.printf("%02d:%02d", columna // 60, columna % 60)
 
-#Hecho por Kevin Lesama Soto
-def turnoDisponibleEstado(session, fecha, hora):
-    try:
-        horaInicio = datetime.strptime(hora, "%H:%M")
-    except ValueError:
+HORARIOS_EN_MINUTOS = [hora_a_minutos(h) for h in settings.HORARIOS_VALIDOS]
+MINUTOS_VALIDOS = frozenset(HORARIOS_EN_MINUTOS)
+
+def version_datos(session):
+    return session.query(VersionDatos.version).filter(VersionDatos.id == 1).scalar() or 0
+
+def contar_filas(session, modelo):
+    # Lee el conteo que mantienen los triggers en vez de hacer COUNT(*)
+    filas = session.query(Conteo.filas).filter(Conteo.tabla == modelo.__tablename__).scalar()
+    if filas is None:
+        filas = session.query(modelo).count()
+    return filas
+
+MENSAJES_DUPLICADO = {
+    "dni": "El DNI ya está registrado",
+    "email": "El email ya está registrado",
+    "telefono": "El teléfono ya está registrado"
+}
+
+def consulta_busqueda_personas(q, con_fts):
+    # Devuelve una subconsulta (id, rango) con las personas que coinciden con q,
+    # o None si q no tiene palabras. Cada palabra se busca como prefijo.
+    palabras = re.findall(r"\w+", q)
+    if not palabras:
+        return None
+    if con_fts:
+        expresion = " ".join(f'"{p}"*' for p in palabras)
+        return (
+            text(
+                "SELECT rowid AS id, bm25(personas_fts, 2.0, 1.0) AS rango "
+                "FROM personas_fts WHERE personas_fts MATCH :expresion"
+            )
+            .bindparams(expresion=expresion)
+            .columns(id=Integer, rango=Float)
+            .subquery()
+        )
+    condiciones = [
+        or_(Persona.nombre.like(f"{p}%"), Persona.nombre.like(f"% {p}%"), Persona.email.like(f"{p}%"))
+        for p in palabras
+    ]
+    return select(Persona.id.label("id"), cast(0, Float).label("rango")).where(*condiciones).subquery()
+
+def campo_duplicado(session, excluir_id=None, **valores):
+    # Una sola consulta con OR sobre los indices unicos de dni, email y telefono.
+    # Devuelve el primer campo que choca con otra persona, o None.
+    valores = {campo: valor for campo, valor in valores.items() if valor is not None}
+    if not valores:
+        return None
+    consulta = session.query(Persona.dni, Persona.email, Persona.telefono).filter(
+        or_(*(getattr(Persona, campo) == valor for campo, valor in valores.items()))
+    )
+    if excluir_id is not None:
+        consulta = consulta.filter(Persona.id != excluir_id)
+    filas = consulta.all()
+    for campo in ("dni", "email", "telefono"):
+        if campo in valores and any(getattr(fila, campo) == valores[campo] for fila in filas):
+            return campo
+    return None
+
+def horarios_ocupados_por_dia(session, desde, hasta):
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+
+    ocupados_por_dia = {}
+    faltantes = []
+    cache_disponibilidad.sincronizar(version_datos(session))
+    for dia in dias:
+        ocupados = cache_disponibilidad.obtener(dia)
+        if ocupados is None:
+            faltantes.append(dia)
+        else:
+            ocupados_por_dia[dia] = ocupados
+    if not faltantes:
+        return ocupados_por_dia
+
+    # Una sola consulta agrupada por fecha sobre el indice (fecha, hora, estado),
+    # acotada a los dias que no estaban en cache.
+    version = cache_disponibilidad.version
+    filas = (
+        session.query(Turnos.fecha, func.group_concat(Turnos.hora))
+        .filter(
+            Turnos.fecha >= faltantes[0],
+            Turnos.fecha <= faltantes[-1],
+            Turnos.estado != settings.ESTADO_CANCELADO
+        )
+        .group_by(Turnos.fecha)
+        .all()
+    )
+    leidos = {dia: frozenset() for dia in faltantes}
+    leidos.update({fecha: frozenset(int(m) for m in horas.split(",")) for fecha, horas in filas})
+    cache_disponibilidad.guardar(leidos, version)
+
+    ocupados_por_dia.update(leidos)
+    return ocupados_por_dia
+
+def proximos_horarios_libres(session, desde, hasta, n, desde_minutos=0):
+    # Recorre en orden de fecha los dias con turnos activos (una fila agrupada por
+    # dia, sobre el indice) y corta apenas junta n horarios. Los dias completos se
+    # saltean por la cantidad, sin armar sus horarios; los dias sin turnos no
+    # vienen en la consulta y estan enteros libres.
+    libres = []
+
+    def agregar(dia, ocupados):
+        minimo = desde_minutos if dia == desde else 0
+        for hora, minutos in zip(settings.HORARIOS_VALIDOS, HORARIOS_EN_MINUTOS):
+            if minutos >= minimo and minutos not in ocupados:
+                libres.append({"fecha": dia.isoformat(), "hora": hora})
+                if len(libres) >= n:
+                    return True
         return False
-    
-    horaFin = horaInicio + timedelta(minutes=30)
 
-    turnos = session.query(Turnos).filter_by(fecha=fecha, hora=hora).all()
-    for t in turnos:
-        if t.estado != "cancelado":
-            return False
-    return True
-#si el turno esta cancelado retorna true
+    consulta = (
+        select(Turnos.fecha, func.count(Turnos.id), func.group_concat(Turnos.hora))
+        .where(
+            Turnos.fecha >= desde,
+            Turnos.fecha <= hasta,
+            Turnos.estado != settings.ESTADO_CANCELADO
+        )
+        .group_by(Turnos.fecha)
+        .order_by(Turnos.fecha)
+        .execution_options(yield_per=32)
+    )
+    resultado = session.execute(consulta)
+    try:
+        dia = desde
+        for fecha, cantidad, horas in resultado:
+            while dia < fecha:
+                if agregar(dia, ()):
+                    return libres
+                dia += timedelta(days=1)
+            if cantidad < len(HORARIOS_EN_MINUTOS):
+                if agregar(fecha, {int(m) for m in horas.split(",")}):
+                    return libres
+            dia = fecha + timedelta(days=1)
+    finally:
+        resultado.close()
+
+    while dia <= hasta:
+        if agregar(dia, ()):
+            return libres
+        dia += timedelta(days=1)
+    return libres
+
+def horarios_libres(ocupados):
+    return [h for h, m in zip(settings.HORARIOS_VALIDOS, HORARIOS_EN_MINUTOS) if m not in ocupados]
+
+def mascara_horarios(ocupados):
+    # Bit i encendido = settings.HORARIOS_VALIDOS[i] libre
+    mascara = 0
+    for i, m in enumerate(HORARIOS_EN_MINUTOS):
+        if m not in ocupados:
+            mascara |= 1 << i
+    return mascara
+
+def inicio_ventana_cancelaciones():
+    return date.today() - timedelta(days=settings.DIAS_VENTANA_CANCELACIONES)
+
+def registrar_cancelacion(session, persona_id, turno_id, fecha):
+    # Se anota en el registro y se suma al contador de la persona en la misma
+    # transaccion que cambia el estado del turno; no hace commit.
+    if fecha < inicio_ventana_cancelaciones():
+        return
+    session.add(Cancelacion(persona_id=persona_id, turno_id=turno_id, fecha=fecha))
+    session.query(Persona).filter(Persona.id == persona_id).update({
+        Persona.cancelaciones_recientes: Persona.cancelaciones_recientes + 1,
+        # Solo se deshabilita al llegar al limite; si despues alguien la habilita
+        # a mano, las cancelaciones siguientes no la vuelven a deshabilitar.
+        Persona.habilitado: case(
+            (Persona.cancelaciones_recientes + 1 == settings.MAX_CANCELACIONES, False),
+            else_=Persona.habilitado
+        )
+    }, synchronize_session=False)
+
+def recalcular_cancelaciones(session, persona_ids):
+    # Recalcula el contador desde el registro en vez de restar, asi correrlo dos
+    # veces (o desde dos workers a la vez) deja el mismo resultado.
+    # habilitado solo cambia si el contador baja del limite (la persona fue
+    # deshabilitada por cancelaciones); a las deshabilitadas a mano no las toca.
+    if not persona_ids:
+        return
+    cantidad = (
+        session.query(func.count(Cancelacion.id))
+        .filter(Cancelacion.persona_id == Persona.id)
+        .scalar_subquery()
+    )
+    session.query(Persona).filter(Persona.id.in_(persona_ids)).update({
+        Persona.cancelaciones_recientes: cantidad,
+        Persona.habilitado: case(
+            (and_(
+                Persona.cancelaciones_recientes >= settings.MAX_CANCELACIONES,
+                cantidad < settings.MAX_CANCELACIONES
+            ), True),
+            else_=Persona.habilitado
+        )
+    }, synchronize_session=False)
+
+def anular_cancelacion(session, turno_id):
+    cancelacion = session.query(Cancelacion).filter_by(turno_id=turno_id).first()
+    if cancelacion is None:
+        return
+    session.delete(cancelacion)
+    session.flush()
+    recalcular_cancelaciones(session, [cancelacion.persona_id])
 
+def depurar_cancelaciones(session):
+    limite = inicio_ventana_cancelaciones()
+    persona_ids = [
+        id for (id,) in session.query(Cancelacion.persona_id)
+        .filter(Cancelacion.fecha < limite)
+        .distinct()
+    ]
+    if not persona_ids:
+        return 0
+    session.query(Cancelacion).filter(Cancelacion.fecha < limite).delete(synchronize_session=False)
+    recalcular_cancelaciones(session, persona_ids)
+    session.commit()
+    return len(persona_ids)
 
 #hecho por Orion Quimey Jaime
 MESES_ESPANOL = [